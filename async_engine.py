@@ -0,0 +1,216 @@
+"""
+基于 asyncio 的并发预约引擎
+
+make_reservation 每次 session.post 都会阻塞整个进程，一个进程只能跑一个预约。
+这里把每个预约任务变成一个协程，HTTP 请求放到线程池里执行，
+重试等待用 asyncio.sleep，这样一个事件循环可以同时驱动很多个预约任务。
+成功/重试的判断和 make_reservation 完全一致。
+"""
+import asyncio
+import datetime
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from rate_control import exception_kind, fixed_pacer, response_kind
+from log_queue import log_launch
+from hedge import build_launcher
+from connection_pool import open_connections
+from eportal import (
+    build_launch_data,
+    classify_response,
+    encode_launch_body,
+    late_success,
+    eportal_url,
+    launch_headers,
+    open_reservation_pages,
+)
+
+log = logging.getLogger('async_engine')
+
+
+async def make_reservation_async(session, reservations, resource_id, max_attempts=1000, retry_delay=0.1,
+                                 request_timeout=10, name=None, pacer=None, fast_send=False, hedge=None,
+                                 on_response=None, open_pages=True):
+    """
+    make_reservation 的协程版本，支持重试机制
+    :param session: 会话对象（每个任务最好使用自己的session）
+    :param reservations: 预约信息列表
+    :param resource_id: 资源ID
+    :param max_attempts: 最大尝试次数
+    :param retry_delay: 重试间隔（秒）
+    :param request_timeout: 单次请求超时时间（秒）
+    :param name: 任务名，用于输出
+    :param pacer: 可选，rate_control.AdaptivePacer；不传时固定为 retry_delay
+    :param fast_send: 是否用 fast_send.FastLauncher 提交预先编码好的请求
+    :param hedge: 可选，hedge.hedge_options 的结果，开启对冲提交
+    :param on_response: 可选，每收到一个响应调用 on_response(result, 发出时间戳, 收到时间戳)
+    :param open_pages: 是否先访问大厅和详情页（已经访问过时可以跳过）
+    :return: 是否预约成功
+    """
+    name = name or f"resource {resource_id}"
+    if not session:
+        print(f"[{name}] 未登录，无法进行预约")
+        return False
+    if pacer is None:
+        pacer = fixed_pacer(retry_delay)
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        if open_pages:
+            await loop.run_in_executor(None, open_reservation_pages, session, resource_id)
+
+        reserve_url = eportal_url("/site/reservation/launch")
+        reserve_headers = launch_headers(resource_id)
+        data = build_launch_data(resource_id, reservations)
+        launcher = build_launcher(session, resource_id, [encode_launch_body(resource_id, reservations)], fast_send, hedge)
+
+        def post(attempt):
+            sent_at = time.time()
+            try:
+                if launcher:
+                    result = launcher.send(0, request_timeout)
+                else:
+                    result = session.post(reserve_url, headers=reserve_headers, data=data, timeout=request_timeout).json()
+            except Exception as e:
+                log_launch(log, exception_kind(e), sent_at, job=name, attempt=attempt)
+                raise
+            if on_response:
+                on_response(result, sent_at, time.time())
+            log_launch(log, response_kind(result), sent_at, job=name, attempt=attempt)
+            return result
+
+        attempt_count = 0
+        start_time = datetime.datetime.now()
+
+        while attempt_count < max_attempts:
+            attempt_count += 1
+
+            try:
+                result = await loop.run_in_executor(None, post, attempt_count)
+
+                status = classify_response(result)
+                if status == 'success':
+                    pacer.record('success')
+                    elapsed_time = (datetime.datetime.now() - start_time).total_seconds()
+                    print(f"[{name}] 预约成功！预约ID：{result['d']['appointment_id']}，"
+                          f"第 {attempt_count} 次尝试，用时 {elapsed_time:.1f}秒")
+                    return True
+                if status != 'retry':
+                    log.warning("[%s] [警告] 预约失败：%s，继续尝试...", name, result.get('m', '未知错误'))
+                kind = response_kind(result)
+
+            except requests.exceptions.Timeout:
+                log.warning("[%s] [警告] 请求超时，继续尝试...", name)
+                kind = 'timeout'
+            except requests.exceptions.ConnectionError:
+                log.warning("[%s] [警告] 连接错误，继续尝试...", name)
+                kind = 'connection_error'
+            except json.JSONDecodeError:
+                log.warning("[%s] [警告] 响应解析错误，继续尝试...", name)
+                kind = 'bad_response'
+            except Exception as e:
+                log.warning("[%s] [警告] 请求异常：%s，继续尝试...", name, e)
+                kind = 'exception'
+
+            await asyncio.sleep(pacer.next_delay(kind))
+
+        result = await loop.run_in_executor(None, late_success, launcher, request_timeout)
+        if result:
+            print(f"[{name}] 预约成功！预约ID：{result['d']['appointment_id']}（之前在途的请求）")
+            return True
+        print(f"[{name}] 达到最大尝试次数（{max_attempts}次），预约失败")
+        return False
+
+    except Exception as e:
+        print(f"[{name}] 预约请求初始化失败：{str(e)}")
+        return False
+
+
+async def wait_until_async(target_time, offset=0.0, rtt=0.0, spin=0.02):
+    """
+    协程版的定时等待（见 clock_sync.precise_wait_until）
+    大部分时间用 asyncio.sleep 让出事件循环，最后 spin 秒忙等；
+    忙等时每次检查都用 asyncio.sleep(0) 让出，同一时刻开抢的其他任务不会被卡住
+    """
+    fire_at = target_time.timestamp() - offset - rtt / 2
+    remaining = fire_at - time.time()
+    if remaining > spin:
+        await asyncio.sleep(remaining - spin)
+    while time.time() < fire_at:
+        await asyncio.sleep(0)
+
+
+async def _refresh_pool(session, pool_size, release_time, clock, lead):
+    """开抢前 lead 秒刷新一次连接池，长时间等待后空闲连接可能已被服务器关闭"""
+    refresh_time = release_time - datetime.timedelta(seconds=lead)
+    # release_time 是服务器时间，和 wait_until_async 一样按时钟偏差换算成本地时间再比较
+    if time.time() >= refresh_time.timestamp() - clock.get('offset', 0.0):
+        return
+    await wait_until_async(refresh_time, clock.get('offset', 0.0))
+    loop = asyncio.get_running_loop()
+    opened = await loop.run_in_executor(None, open_connections, session, pool_size)
+    print(f"[预热] 开始前刷新连接 {opened}/{pool_size}")
+
+
+async def _run_job(job, clock):
+    job = dict(job)
+    release_time = job.pop('release_time', None)
+    job.pop('pool_size', None)
+    if release_time:
+        # 大厅和详情页在等待前访问，开放后第一个请求就是 launch
+        if job.get('open_pages', True) and job.get('session'):
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, open_reservation_pages, job['session'], job['resource_id'])
+                job['open_pages'] = False
+            except Exception as e:
+                print(f"[{job.get('name') or job['resource_id']}] 访问预约页面失败，开抢时重试：{e}")
+        await wait_until_async(release_time, clock.get('offset', 0.0), clock.get('rtt', 0.0))
+    return await make_reservation_async(**job)
+
+
+async def run_jobs(jobs, max_workers=None, clock=None, warmup_lead=3.0):
+    """
+    在同一个事件循环里并发执行多个预约任务
+    :param jobs: 任务列表，每个任务是一个dict，键与 make_reservation_async 的参数同名
+                 （session、reservations、resource_id 必填，其余可选）；
+                 可额外带 release_time（datetime），任务会等到该服务器时间才开始提交
+    :param max_workers: 执行HTTP请求的线程数，默认每个任务一个线程
+    :param clock: clock_sync.measure_clock_offset 的结果，用于按服务器时间等待
+    :param warmup_lead: 任务带 pool_size 时，在 release_time 前多少秒刷新该session的连接池
+                        （同一个session、同一开始时间只刷新一次）
+    :return: 与 jobs 顺序一致的结果列表（True/False）
+    """
+    if not jobs:
+        return []
+    clock = clock or {}
+    refreshes = {}
+    for job in jobs:
+        if job.get('pool_size') and job.get('release_time') and job.get('session'):
+            key = (id(job['session']), job['release_time'])
+            size = max(job['pool_size'], refreshes[key][1] if key in refreshes else 0)
+            refreshes[key] = (job['session'], size, job['release_time'])
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=(max_workers or len(jobs)) + len(refreshes))
+    loop.set_default_executor(executor)
+    try:
+        tasks = [_refresh_pool(session, size, release_time, clock, warmup_lead)
+                 for session, size, release_time in refreshes.values()]
+        results = await asyncio.gather(
+            *(_run_job(job, clock) for job in jobs), *tasks,
+            return_exceptions=True
+        )
+        results = results[:len(jobs)]
+    finally:
+        executor.shutdown(wait=False)
+    return [result is True for result in results]
+
+
+def run_reservation_jobs(jobs, max_workers=None, clock=None, warmup_lead=3.0):
+    """同步入口：创建事件循环并执行全部预约任务，返回结果列表"""
+    return asyncio.run(run_jobs(jobs, max_workers, clock, warmup_lead))
@@ -0,0 +1,112 @@
+"""
+场地余量轮询
+
+resource-info-margin 接口对每个 时间段×台号 都返回一条记录，其中带有余量信息。
+AvailabilityPoller 在后台线程里定时拉取 margin 数据，与上一次快照逐条比较，
+只把发生变化的场地应用到当前状态上（新快照里没有的场地从状态中删除），预约引擎据此优先向还空着的场地发请求。
+余量字段是按接口返回猜测的，开放前的快照也可能全部显示约满，所以余量只作参考：
+所有候选都显示约满时仍然按优先级提交，只有服务器明确告知已被约走的候选才会放弃。
+"""
+import threading
+import time
+
+import requests
+
+from eportal import fetch_margin
+
+
+def is_slot_free(record):
+    """
+    判断一条 margin 记录是否还能预约
+    margin 接口用 margin（剩余数量）表示余量；部分场馆还会带 is_reserve 字段
+    """
+    if 'margin' in record:
+        try:
+            return int(record['margin'] or 0) > 0
+        except (TypeError, ValueError):
+            return True
+    if 'is_reserve' in record:
+        return not record['is_reserve']
+    # 不认识的格式视为可预约，由服务器的返回结果来判断
+    return True
+
+
+def snapshot_availability(d):
+    """把 margin 数据转换成快照：{(time_id, sub_id): 是否可预约}"""
+    return {(int(v['time_id']), int(v['sub_id'])): is_slot_free(v) for vlist in d.values() for v in vlist}
+
+
+def diff_snapshots(old, new):
+    """
+    返回 new 相对 old 发生变化的场地：{(time_id, sub_id): 是否可预约}
+    新出现的场地也算变化，new 里已经没有的场地值为 None
+    """
+    changes = {key: free for key, free in new.items() if old.get(key) != free}
+    changes.update((key, None) for key in old.keys() - new.keys())
+    return changes
+
+
+class AvailabilityPoller(threading.Thread):
+    """
+    后台轮询某个场馆某一天的余量
+    :param session: 会话对象，只用于复制cookie，轮询使用独立的连接，不占用提交预约的连接池
+    :param resource_id: 资源ID
+    :param date: 预约日期
+    :param interval: 轮询间隔（秒）
+    :param on_change: 有场地状态变化时的回调，参数为 diff_snapshots 的结果
+    """
+
+    def __init__(self, session, resource_id, date, interval=1.0, on_change=None):
+        super().__init__(daemon=True)
+        self.session = requests.Session()
+        self.session.headers.update(session.headers)
+        self.session.cookies.update(session.cookies)
+        self.resource_id = resource_id
+        self.date = date
+        self.interval = interval
+        self.on_change = on_change
+        self.state = {}
+        self.polls = 0
+        self.updated_at = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def poll_once(self):
+        """拉取一次快照并增量更新状态，返回本次的变化"""
+        snapshot = snapshot_availability(fetch_margin(self.session, self.resource_id, self.date))
+        with self._lock:
+            changes = diff_snapshots(self.state, snapshot)
+            for key, free in changes.items():
+                if free is None:
+                    self.state.pop(key, None)
+                else:
+                    self.state[key] = free
+            self.polls += 1
+            self.updated_at = time.time()
+        if changes and self.on_change:
+            self.on_change(changes)
+        return changes
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"\n[余量] 拉取场地余量失败：{e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def is_free(self, period, sub_resource_id):
+        """还没拉到数据（或已从快照中消失）的场地视为可预约"""
+        with self._lock:
+            return self.state.get((int(period), int(sub_resource_id)), True)
+
+    def candidate_available(self, reservations):
+        """一个候选（预约信息列表）中的所有场地都空着才算可用"""
+        return all(self.is_free(r['period'], r['sub_resource_id']) for r in reservations)
+
+    def free_slots(self):
+        with self._lock:
+            return [key for key, free in self.state.items() if free]
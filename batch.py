@@ -0,0 +1,228 @@
+"""
+多账号批量预约
+
+从任务文件读取多个账号的预约任务（每个账号一个cookie文件），在一个进程里：
+1. 预先加载所有session，并行检查cookie是否有效
+2. 解析每个任务要预约的场地ID
+3. 预热连接、校准服务器时钟
+4. 每个任务在自己的开抢时间提交，全部结束后输出汇总
+
+用法：
+    python batch.py --jobs jobs.json
+
+任务文件格式见 jobs.example.json。每个任务可以直接给出 reservations（period/sub_resource_id），
+也可以给出 slots（yaxis 时间段 + abscissa 台号），由 margin 数据查出ID。
+"""
+import argparse
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from eportal import check_session, get_session_with_cookie, parse_time, slot_index
+from margin_cache import get_layout
+from connection_pool import warm_up_session
+from hedge import hedge_options
+from release_profile import ReleaseProfiler, DEFAULT_HISTORY_FILE
+from clock_sync import measure_clock_offset
+from async_engine import run_reservation_jobs
+from rate_control import pacer_from_config
+from log_queue import setup_logging
+
+# 任务里可以覆盖的预约参数及默认值
+JOB_DEFAULTS = {
+    "max_attempts": 1000,
+    "retry_delay": 0.2,
+    "request_timeout": 3,
+}
+
+
+def load_jobs(jobs_file):
+    """读取任务文件，把 defaults 合并进每个任务"""
+    with open(jobs_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    defaults = dict(JOB_DEFAULTS, **data.get('defaults', {}))
+    jobs = []
+    for i, job in enumerate(data.get('jobs', [])):
+        merged = dict(defaults, **job)
+        merged.setdefault('name', f"任务{i + 1}")
+        jobs.append(merged)
+    return jobs, defaults
+
+
+def load_sessions(jobs):
+    """每个cookie文件只加载一次：{cookie_file: session}"""
+    sessions = {}
+    for job in jobs:
+        cookie_file = job.get('cookie_file', 'cookie.txt')
+        if cookie_file not in sessions:
+            sessions[cookie_file] = get_session_with_cookie(cookie_file)
+    return sessions
+
+
+def validate_sessions(sessions, max_workers=16):
+    """并行检查所有session，返回 {cookie_file: 是否有效}"""
+    def check(item):
+        cookie_file, session = item
+        if not session:
+            return cookie_file, False
+        try:
+            return cookie_file, check_session(session)
+        except Exception as e:
+            print(f"[{cookie_file}] 检查cookie失败：{e}")
+            return cookie_file, False
+
+    if not sessions:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(sessions))) as executor:
+        return dict(executor.map(check, sessions.items()))
+
+
+def resolve_reservations(job, session, margin_cache_ttl=600):
+    """
+    得到任务的预约信息列表
+    slots 中的 yaxis/abscissa 通过 margin 数据查出 period 和 sub_resource_id
+    """
+    date = job['date']
+    if job.get('reservations'):
+        return [dict(r, date=r.get('date', date)) for r in job['reservations']]
+    layout = get_layout(session, job['resource_id'], date, margin_cache_ttl)
+    index = slot_index(layout)
+    reservations = []
+    for slot in job.get('slots', []):
+        key = (slot['yaxis'], slot['abscissa'])
+        if key not in index:
+            raise ValueError(f"场地数据中没有 {key[0]} {key[1]} 这个组合")
+        period, sub_resource_id = index[key]
+        reservations.append({"date": date, "period": period, "sub_resource_id": sub_resource_id})
+    if not reservations:
+        raise ValueError("任务中没有 reservations 或 slots")
+    return reservations
+
+
+def print_summary(results):
+    print("\n===== 预约结果汇总 =====")
+    for r in results:
+        print(f"{r['name']}\tresource {r['resource_id']}\t{r['date']}\t{r['status']}")
+    ok = sum(1 for r in results if r['status'] == '成功')
+    print(f"共 {len(results)} 个任务，成功 {ok} 个，失败 {len(results) - ok} 个")
+
+
+def prepare_jobs(jobs, defaults):
+    """
+    加载并检查session、解析每个任务的场地ID
+    :return: (results, runnable, sessions)；results 与 jobs 一一对应，runnable 为 [(result, cookie_file, engine_job)]
+    """
+    sessions = load_sessions(jobs)
+    valid = validate_sessions(sessions)
+    for cookie_file, ok in valid.items():
+        if not ok:
+            print(f"[{cookie_file}] cookie无效或已失效，相关任务将跳过")
+
+    results = []
+    runnable = []
+    for job in jobs:
+        result = {"name": job['name'], "resource_id": job.get('resource_id'), "date": job.get('date')}
+        results.append(result)
+        cookie_file = job.get('cookie_file', 'cookie.txt')
+        if not valid.get(cookie_file):
+            result['status'] = "cookie无效"
+            continue
+        session = sessions[cookie_file]
+        try:
+            reservations = resolve_reservations(job, session, defaults.get('margin_cache_ttl', 600))
+        except Exception as e:
+            print(f"[{job['name']}] 解析场地ID失败：{e}")
+            result['status'] = "ID解析失败"
+            continue
+        release_time = parse_time(job['time']) if job.get('time') else None
+        if job.get('time') and not release_time:
+            result['status'] = "时间格式错误"
+            continue
+        runnable.append((result, cookie_file, {
+            "session": session,
+            "reservations": reservations,
+            "resource_id": job['resource_id'],
+            "max_attempts": job['max_attempts'],
+            "retry_delay": job['retry_delay'],
+            "request_timeout": job['request_timeout'],
+            "name": job['name'],
+            "release_time": release_time,
+            "pacer": pacer_from_config(job),
+            "fast_send": job.get('fast_send', False),
+            "hedge": hedge_options(job),
+        }))
+    return results, runnable, sessions
+
+
+def warm_up_jobs(runnable, sessions, defaults):
+    """
+    同一个账号的多个任务共用一个session，连接池按该账号的任务数（开启对冲时按并发上限）预热
+    连接池大小记在每个任务的 pool_size 里，开抢前 warmup_lead 秒会按它再刷新一次
+    """
+    job_counts = Counter(cookie_file for _, cookie_file, _ in runnable)
+    hedge_limits = Counter()
+    for _, cookie_file, engine_job in runnable:
+        if engine_job['hedge']:
+            hedge_limits[cookie_file] = max(hedge_limits[cookie_file], engine_job['hedge']['account_concurrency'])
+    pool_sizes = {cookie_file: max(defaults.get('warmup_connections', 2), count, hedge_limits[cookie_file])
+                  for cookie_file, count in job_counts.items()}
+    for cookie_file, pool_size in pool_sizes.items():
+        warm_up_session(sessions[cookie_file], pool_size)
+    for _, cookie_file, engine_job in runnable:
+        engine_job['pool_size'] = pool_sizes[cookie_file]
+
+
+def run_jobs(runnable, clock, profilers, history_file=DEFAULT_HISTORY_FILE, warmup_lead=3):
+    """
+    提交全部任务，结果写进每个任务的 result['status']
+    有开始时间的任务按 (resource_id, 开始时间) 记录开放时刻，同一场馆的多个任务共用一个记录
+    :param profilers: dict，创建的 ReleaseProfiler 放在这里，由调用方保存（出错时也能保存已有的记录）
+    :param warmup_lead: 开抢前多少秒刷新连接池
+    """
+    for _, _, engine_job in runnable:
+        if history_file and engine_job['release_time']:
+            key = (engine_job['resource_id'], engine_job['release_time'])
+            if key not in profilers:
+                profilers[key] = ReleaseProfiler(engine_job['resource_id'], engine_job['release_time'], clock)
+            engine_job['on_response'] = profilers[key].observe
+
+    outcomes = run_reservation_jobs([engine_job for _, _, engine_job in runnable], clock=clock, warmup_lead=warmup_lead)
+    for (result, _, _), ok in zip(runnable, outcomes):
+        result['status'] = "成功" if ok else "失败"
+
+
+def run_batch(jobs_file):
+    """执行任务文件中的全部任务，返回每个任务的结果列表"""
+    jobs, defaults = load_jobs(jobs_file)
+    print(f"共 {len(jobs)} 个任务")
+
+    results, runnable, sessions = prepare_jobs(jobs, defaults)
+    if runnable:
+        warm_up_jobs(runnable, sessions, defaults)
+
+        clock = measure_clock_offset(runnable[0][2]['session']) or {}
+        if clock:
+            print(f"[校时] 服务器时钟偏差 {clock['offset'] * 1000:+.0f}ms，RTT {clock['rtt'] * 1000:.0f}ms")
+
+        history_file = defaults.get('release_history_file', DEFAULT_HISTORY_FILE)
+        profilers = {}
+        try:
+            run_jobs(runnable, clock, profilers, history_file, defaults.get('warmup_lead', 3))
+        finally:
+            for profiler in profilers.values():
+                profiler.save(history_file)
+
+    print_summary(results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多账号批量预约')
+    parser.add_argument('--jobs', type=str, default='jobs.json', help='任务文件')
+    args = parser.parse_args()
+    setup_logging()
+    run_batch(args.jobs)
+
+
+if __name__ == "__main__":
+    main()
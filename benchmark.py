@@ -0,0 +1,296 @@
+"""
+离线性能测试
+
+基于 mock_eportal.py 的本地模拟服务器，不需要连接真实的 eportal：
+- wait：比较 wait_until 和 clock_sync.precise_wait_until 的触发误差
+- reserve：多个任务同时抢场地，统计开放后第一个被受理请求的时间、第一次成功的时间和成功率
+- send：比较 session.post 和 fast_send.FastLauncher 每次提交消耗的客户端CPU时间
+- hedge：部分请求卡顿时，比较普通提交和对冲提交（hedge.HedgedSender）的尾延迟
+- startup：比较 python try.py 和 python reserve.py check 从启动到退出的时间
+
+用法：
+    python benchmark.py --jobs 20 --engine async --latency 0.02 --throttle 10 --competitors 3
+结果会打印出来，并追加写入 --output 指定的 JSON Lines 文件，方便比较修改前后的表现。
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import eportal
+from eportal import (encode_launch_body, eportal_url, fetch_margin_layout, launch_headers, make_reservation,
+                     set_base_url, wait_until)
+from clock_sync import precise_wait_until
+from async_engine import run_reservation_jobs
+from fast_send import FastLauncher
+from hedge import HedgedSender, PostSender
+from metrics import percentile
+from mock_eportal import MockEportal
+from rate_control import AdaptivePacer, fixed_pacer
+
+BENCH_RESOURCE_ID = "57"
+
+
+def _describe(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        "mean": round(statistics.mean(values), 3),
+        "p50": round(values[len(values) // 2], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def bench_wait(trials=10, lead=0.3):
+    """比较两种等待方式的触发误差（毫秒，正数表示晚了）"""
+    results = {}
+    for name, wait in (("wait_until", wait_until), ("precise_wait_until", precise_wait_until)):
+        lateness = []
+        for _ in range(trials):
+            target = datetime.datetime.now() + datetime.timedelta(seconds=lead)
+            with contextlib.redirect_stdout(io.StringIO()):
+                wait(target)
+            lateness.append((time.time() - target.timestamp()) * 1000)
+        results[name] = _describe(lateness)
+    return results
+
+
+def bench_send(attempts=2000):
+    """
+    在没有延迟、一直未开放的模拟服务器上连续提交 attempts 次，
+    比较 session.post 和 FastLauncher 每次提交消耗的客户端CPU时间（微秒）
+    用 time.thread_time 只统计发请求的线程，模拟服务器本身的CPU时间不计入
+    """
+    mock = MockEportal(release_at=float('inf'))
+    base_url = eportal.BASE_URL
+    set_base_url(mock.start())
+    try:
+        session = requests.Session()
+        session.cookies.set('PHPSESSID', 'bench-send')
+        reservations = [{"date": datetime.date.today().isoformat(), "period": 4439, "sub_resource_id": 20842}]
+        url = eportal_url("/site/reservation/launch")
+        headers = launch_headers(BENCH_RESOURCE_ID)
+        data = encode_launch_body(BENCH_RESOURCE_ID, reservations)
+        launcher = FastLauncher(session, BENCH_RESOURCE_ID, [data])
+
+        senders = {
+            "session_post": lambda: session.post(url, headers=headers, data=data, timeout=5).json(),
+            "fast_send": lambda: launcher.send(0, 5),
+        }
+        results = {}
+        for name, send in senders.items():
+            send()  # 先建立连接
+            cpu0, wall0 = time.thread_time(), time.perf_counter()
+            for _ in range(attempts):
+                send()
+            cpu, wall = time.thread_time() - cpu0, time.perf_counter() - wall0
+            results[name] = {"cpu_us": round(cpu / attempts * 1e6, 1), "wall_us": round(wall / attempts * 1e6, 1)}
+    finally:
+        mock.stop()
+        set_base_url(base_url)
+    results['cpu_saved_pct'] = round(100 * (1 - results['fast_send']['cpu_us'] / results['session_post']['cpu_us']), 1)
+    return results
+
+
+def bench_startup(runs=10):
+    """
+    进程启动开销：分别启动 runs 次，统计从启动到退出的时间（毫秒）
+    - python：空解释器
+    - try：python try.py（导入全部模块、设置日志、读取配置）
+    - reserve_check：python reserve.py check（只读取快照）
+    在临时目录里运行，不会读到真实的 config.json 和 cookie
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        "python": [sys.executable, "-c", "pass"],
+        "try": [sys.executable, os.path.join(here, "try.py")],
+        "reserve_check": [sys.executable, os.path.join(here, "reserve.py"), "check"],
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = {"version": 1, "config_file": os.path.join(tmp, "config.json"), "config_mtime": 0,
+                    "cookie_file": "cookie.txt", "resource_id": "57", "date": datetime.date.today().isoformat(),
+                    "candidates": [[{"date": datetime.date.today().isoformat(), "period": 1, "sub_resource_id": 1}]],
+                    "options": {}}
+        with open(os.path.join(tmp, "reserve_snapshot.json"), 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        for name, command in commands.items():
+            times = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                subprocess.run(command, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                times.append((time.perf_counter() - t0) * 1000)
+            results[name] = {"median": round(statistics.median(times), 1), "min": round(min(times), 1)}
+    return results
+
+
+def bench_hedge(attempts=300, latency=0.01, stall_rate=0.05, stall=0.5, hedge_requests=2):
+    """
+    每个请求有 stall_rate 的概率卡顿 stall 秒，依次提交 attempts 次，
+    比较普通提交和对冲提交每次拿到回复的耗时（毫秒）
+    """
+    mock = MockEportal(release_at=float('inf'), latency=latency, stall_rate=stall_rate, stall=stall, seed=1)
+    base_url = eportal.BASE_URL
+    set_base_url(mock.start())
+    try:
+        results = {}
+        for name, requests_in_flight in (("single", 1), ("hedged", hedge_requests)):
+            session = requests.Session()
+            session.cookies.set('PHPSESSID', f'bench-{name}')
+            reservations = [{"date": datetime.date.today().isoformat(), "period": 4439, "sub_resource_id": 20842}]
+            sender = PostSender(session, BENCH_RESOURCE_ID, [encode_launch_body(BENCH_RESOURCE_ID, reservations)])
+            if requests_in_flight > 1:
+                # 多留一个名额，上一次卡住的请求还没结束时也能对冲
+                sender = HedgedSender(sender, session, requests_in_flight, hedge_delay=latency * 3,
+                                      account_concurrency=requests_in_flight + 1)
+            elapsed = []
+            for _ in range(attempts):
+                t0 = time.perf_counter()
+                sender.send(0, 5)
+                elapsed.append((time.perf_counter() - t0) * 1000)
+            results[name] = {"p50": round(percentile(elapsed, 50), 2), "p95": round(percentile(elapsed, 95), 2),
+                             "p99": round(percentile(elapsed, 99), 2), "max": round(max(elapsed), 2)}
+            if requests_in_flight > 1:
+                results[name].update(sender.stats())
+    finally:
+        mock.stop()
+        set_base_url(base_url)
+    results['launch_requests'] = mock.stats['launch']
+    return results
+
+
+def bench_reservation(jobs=20, engine='sync', latency=0.02, jitter=0.01, throttle=10, competitors=3,
+                      release_in=1.0, retry_delay=0.05, max_attempts=200, adaptive=True, contended=True,
+                      fast_send=False):
+    """
+    在模拟服务器上同时运行 jobs 个预约任务
+    :param engine: 'sync'（每个任务一个线程跑 make_reservation）或 'async'（async_engine）
+    :param contended: 为True时多个任务争抢同一批场地
+    :param fast_send: 是否用 fast_send.FastLauncher 提交
+    :return: 统计结果dict
+    """
+    release_at = time.time() + release_in
+    mock = MockEportal(release_at, latency, jitter, throttle, competitors=competitors, seed=1)
+    base_url = eportal.BASE_URL
+    set_base_url(mock.start())
+    try:
+        sessions = []
+        for i in range(jobs):
+            session = requests.Session()
+            session.cookies.set('PHPSESSID', f'bench-{i}')
+            sessions.append(session)
+
+        date = datetime.date.today().isoformat()
+        layout = fetch_margin_layout(sessions[0], BENCH_RESOURCE_ID, date)
+        slots = layout['slots']
+        target_count = max(1, jobs // 2) if contended else jobs
+        job_reservations = []
+        for i in range(jobs):
+            yaxis, abscissa, period, sub_id = slots[i % target_count % len(slots)]
+            job_reservations.append([{"date": date, "period": period, "sub_resource_id": sub_id}])
+
+        def pacer():
+            return AdaptivePacer(retry_delay) if adaptive else fixed_pacer(retry_delay)
+
+        # 提前一点开始，模拟开放前的「预约日期未达到」阶段
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            wait_until(datetime.datetime.fromtimestamp(release_at - 0.2))
+            if engine == 'async':
+                outcomes = run_reservation_jobs([
+                    {"session": s, "reservations": r, "resource_id": BENCH_RESOURCE_ID, "max_attempts": max_attempts,
+                     "retry_delay": retry_delay, "request_timeout": 5, "pacer": pacer(), "fast_send": fast_send}
+                    for s, r in zip(sessions, job_reservations)
+                ])
+            else:
+                def run(args):
+                    session, reservations = args
+                    launcher = None
+                    if fast_send:
+                        launcher = FastLauncher(session, BENCH_RESOURCE_ID,
+                                                [encode_launch_body(BENCH_RESOURCE_ID, reservations)])
+                    return make_reservation(session, reservations, BENCH_RESOURCE_ID, max_attempts, retry_delay, 5,
+                                            pacer=pacer(), launcher=launcher)
+
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    outcomes = list(executor.map(run, zip(sessions, job_reservations)))
+        elapsed = time.time() - start
+    finally:
+        mock.stop()
+        set_base_url(base_url)
+
+    def since_release(ts):
+        return None if ts is None else round((ts - release_at) * 1000, 2)
+
+    stats = mock.stats
+    return {
+        "engine": engine,
+        "jobs": jobs,
+        "contended": contended,
+        "adaptive": adaptive,
+        "fast_send": fast_send,
+        "success_rate": round(sum(1 for ok in outcomes if ok) / jobs, 3),
+        "first_accepted_ms": since_release(stats['first_accepted_at']),
+        "first_success_ms": since_release(stats['first_success_at']),
+        "launch_requests": stats['launch'],
+        "throttled": stats['throttled'],
+        "not_open": stats['not_open'],
+        "taken": stats['taken'],
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='基于本地模拟服务器的性能测试')
+    parser.add_argument('--jobs', type=int, default=20, help='同时运行的预约任务数')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟服务器延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.01, help='模拟服务器延迟抖动（秒）')
+    parser.add_argument('--throttle', type=int, default=10, help='每个cookie每秒允许的提交次数，0表示不限流')
+    parser.add_argument('--competitors', type=int, default=3, help='虚拟对手数量')
+    parser.add_argument('--retry_delay', type=float, default=0.05)
+    parser.add_argument('--fixed', action='store_true', help='使用固定重试间隔（不自适应）')
+    parser.add_argument('--uncontended', action='store_true', help='每个任务预约不同的场地')
+    parser.add_argument('--fast-send', action='store_true', help='预约测试使用预先编码好的请求提交')
+    parser.add_argument('--wait-trials', type=int, default=10, help='定时误差测试次数，0表示跳过')
+    parser.add_argument('--send-attempts', type=int, default=2000, help='提交开销测试的提交次数，0表示跳过')
+    parser.add_argument('--hedge-attempts', type=int, default=300, help='对冲提交测试的提交次数，0表示跳过')
+    parser.add_argument('--stall-rate', type=float, default=0.05, help='对冲提交测试中请求卡顿的概率')
+    parser.add_argument('--startup-runs', type=int, default=10, help='启动开销测试的启动次数，0表示跳过')
+    parser.add_argument('--output', type=str, default='benchmark.jsonl', help='结果追加写入的文件')
+    args = parser.parse_args()
+
+    report = {"time": datetime.datetime.now().isoformat(timespec='seconds')}
+    if args.wait_trials:
+        report['wait'] = bench_wait(args.wait_trials)
+        print(f"定时误差（毫秒）：{report['wait']}")
+    if args.send_attempts:
+        report['send'] = bench_send(args.send_attempts)
+        print(f"每次提交的开销（微秒）：{report['send']}")
+    if args.startup_runs:
+        report['startup'] = bench_startup(args.startup_runs)
+        print(f"启动开销（毫秒）：{report['startup']}")
+    if args.hedge_attempts:
+        report['hedge'] = bench_hedge(args.hedge_attempts, stall_rate=args.stall_rate)
+        print(f"对冲提交（毫秒）：{report['hedge']}")
+    report['reserve'] = bench_reservation(args.jobs, args.engine, args.latency, args.jitter, args.throttle,
+                                          args.competitors, retry_delay=args.retry_delay, adaptive=not args.fixed,
+                                          contended=not args.uncontended, fast_send=args.fast_send)
+    print(f"预约测试：{report['reserve']}")
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
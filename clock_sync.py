@@ -0,0 +1,164 @@
+"""
+服务器时钟校准和高精度定时
+
+wait_until 每 0.1 秒看一次本地时间，最多会晚 100ms，
+而且本地时钟和 eportal 服务器的时钟本身就可能差好几百毫秒。
+这里通过若干次轻量请求的 Date 响应头估计服务器时钟偏差和往返时间（RTT），
+等待时先粗略 sleep，最后几毫秒忙等，让请求在服务器时间 T 到达。
+"""
+import datetime
+import math
+import statistics
+import time
+from email.utils import parsedate_to_datetime
+
+from eportal import eportal_url, page_headers
+
+
+def _server_timestamp(response):
+    """从响应的 Date 头取出服务器时间戳（精度为1秒），没有则返回None"""
+    date_header = response.headers.get('Date')
+    if not date_header:
+        return None
+    try:
+        return parsedate_to_datetime(date_header).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def measure_clock_offset(session, samples=12, interval=0.15, timeout=3):
+    """
+    估计服务器时钟偏差：服务器时间 = 本地时间 + offset
+    Date 头只精确到秒，所以每个样本只能给出 offset 的一个区间，
+    多个样本错开发送，取区间的交集就能把误差缩小到 interval + RTT 以内。
+    :param session: 会话对象（最好是已经预热过的）
+    :param samples: 采样次数
+    :param interval: 两次采样之间的间隔（秒），不要取整数秒
+    :param timeout: 单次请求超时时间（秒）
+    :return: dict，包含 offset、uncertainty、rtt、jitter（均为秒）和 samples；全部失败时返回None
+    """
+    lower, upper = float('-inf'), float('inf')
+    rtts = []
+    for i in range(samples):
+        if i:
+            time.sleep(interval)
+        sample = _sample_offset(session, timeout)
+        if sample is None:
+            continue
+        rtts.append(sample[2])
+        lower, upper = max(lower, sample[0]), min(upper, sample[1])
+
+    if not rtts:
+        return None
+    return _offset_stats(lower, upper, rtts)
+
+
+def _sample_offset(session, timeout=3):
+    """
+    发一次请求，返回 offset 的区间和往返时间 (lower, upper, rtt)，失败时返回None
+    服务器在 [t0, t1] 之间的某一刻生成了 Date，真实服务器时间在 [server_ts, server_ts + 1) 之内
+    """
+    try:
+        t0 = time.time()
+        resp = session.head(eportal_url("/"), headers=page_headers(), timeout=timeout, allow_redirects=False)
+        t1 = time.time()
+        resp.close()
+    except Exception:
+        return None
+    server_ts = _server_timestamp(resp)
+    if server_ts is None:
+        return None
+    return server_ts - t1, server_ts + 1 - t0, t1 - t0
+
+
+def _offset_stats(lower, upper, rtts):
+    # 样本之间互相矛盾时（例如中途本地时钟被调整）lower 会大于 upper，此时仍取中点
+    return {
+        "offset": (lower + upper) / 2,
+        "uncertainty": abs(upper - lower) / 2,
+        "rtt": statistics.median(rtts),
+        "jitter": statistics.pstdev(rtts) if len(rtts) > 1 else 0.0,
+        "samples": len(rtts),
+    }
+
+
+def refine_clock_offset(session, stats, rounds=6, timeout=3):
+    """
+    用二分法缩小 measure_clock_offset 结果的误差
+    每一轮都算好发送时间，让请求按当前估计恰好在服务器的整秒时刻到达：
+    返回的 Date 是整秒之前还是之后，就说明真实偏差落在当前区间的哪一半，
+    几轮之后误差可以缩小到 RTT 的一半左右。每轮最多等待1秒。
+    :param stats: measure_clock_offset 的结果
+    :return: 新的 stats（格式相同），失败时原样返回
+    """
+    if not stats:
+        return stats
+    lower = stats['offset'] - stats['uncertainty']
+    upper = stats['offset'] + stats['uncertainty']
+    rtts = [stats['rtt']] * stats['samples']
+    for _ in range(rounds):
+        mid = (lower + upper) / 2
+        rtt = statistics.median(rtts)
+        # 下一个服务器整秒对应的本地时间，提前 rtt/2 发出
+        boundary = math.ceil(time.time() + mid + rtt + 0.05)
+        send_at = boundary - mid - rtt / 2
+        time.sleep(max(0.0, send_at - time.time()))
+        sample = _sample_offset(session, timeout)
+        if sample is None:
+            continue
+        rtts.append(sample[2])
+        lower, upper = max(lower, sample[0]), min(upper, sample[1])
+    return _offset_stats(lower, upper, rtts)
+
+
+def precise_wait_until(target_time, offset=0.0, rtt=0.0, spin=0.02):
+    """
+    等待到服务器时间 target_time，让请求恰好在该时刻到达服务器
+    :param target_time: 服务器时间（datetime，本地时区）
+    :param offset: measure_clock_offset 得到的时钟偏差（秒）
+    :param rtt: 往返时间（秒），提前 rtt/2 发出请求
+    :param spin: 最后多少秒改为忙等，避免 sleep 的唤醒误差
+    :return: 实际触发时的本地时间戳
+    """
+    fire_at = target_time.timestamp() - offset - rtt / 2
+    last_print = 0.0
+    while True:
+        remaining = fire_at - time.time()
+        if remaining <= spin:
+            break
+        now = time.monotonic()
+        if now - last_print >= 0.5:
+            print(f"\r距离预约开始还有: {remaining:.1f}秒", end="")
+            last_print = now
+        time.sleep(min(remaining - spin, 0.5))
+    while time.time() < fire_at:
+        pass
+    return time.time()
+
+
+def make_scheduler(session, samples=12, interval=0.15, refine_rounds=0):
+    """
+    校准时钟并返回一个 wait(target_time) 函数，可直接替换 wait_until
+    校准失败时退回到本地时钟
+    :param refine_rounds: 额外用 refine_clock_offset 二分的轮数，0表示不二分
+    """
+    stats = measure_clock_offset(session, samples, interval)
+    if refine_rounds:
+        stats = refine_clock_offset(session, stats, refine_rounds)
+    if stats is None:
+        print("[校时] 无法获取服务器时间，使用本地时钟")
+        stats = {"offset": 0.0, "uncertainty": None, "rtt": 0.0, "jitter": 0.0, "samples": 0}
+    else:
+        print(f"[校时] 服务器时钟偏差 {stats['offset'] * 1000:+.0f}ms（±{stats['uncertainty'] * 1000:.0f}ms），"
+              f"RTT {stats['rtt'] * 1000:.0f}ms，抖动 {stats['jitter'] * 1000:.1f}ms，样本数 {stats['samples']}")
+
+    def wait(target_time):
+        precise_wait_until(target_time, stats['offset'], stats['rtt'])
+
+    wait.stats = stats
+    return wait
+
+
+def server_now(offset=0.0):
+    """按时钟偏差换算出的当前服务器时间"""
+    return datetime.datetime.fromtimestamp(time.time() + offset)
@@ -0,0 +1,101 @@
+"""
+连接预热
+
+预约开始后的第一个 launch 请求如果还要做 DNS 解析、TCP 连接和 TLS 握手，
+会比后面的请求慢好几个往返。这里在开抢前就把若干条 keep-alive 的 HTTPS 连接
+放进 requests.Session 的连接池，并在开抢前几秒再刷新一次，
+这样第一个 launch 请求只需要一次往返。
+"""
+import datetime
+import socket
+import threading
+
+from requests.adapters import HTTPAdapter
+
+import eportal
+from eportal import eportal_url, page_headers, wait_until
+
+
+def resolve_host(host=None, port=None):
+    """解析一次域名，让系统的DNS缓存提前就绪，返回解析到的IP列表"""
+    host = host or eportal.HOST
+    port = port or eportal.PORT
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        print(f"[预热] 域名解析失败：{e}")
+        return []
+    return sorted({info[4][0] for info in infos})
+
+
+def mount_pool(session, pool_size):
+    """给session挂一个能保存 pool_size 条连接的连接池"""
+    existing = session.get_adapter(eportal_url("/"))
+    if getattr(existing, 'recorder', None) is not None:
+        # 已开启耗时统计（metrics.InstrumentedAdapter）时保留统计
+        adapter = type(existing)(existing.recorder, pool_connections=1, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return adapter
+
+
+def open_connections(session, count, timeout=5):
+    """
+    同时发出 count 个轻量请求，迫使连接池建立 count 条不同的连接
+    请求结束后连接会留在池里，之后的请求直接复用
+    :return: 成功建立（或刷新）的连接数
+    """
+    barrier = threading.Barrier(count)
+    ok = []
+
+    def worker():
+        try:
+            barrier.wait(timeout)
+            resp = session.head(eportal_url("/"), headers=page_headers(), timeout=timeout, allow_redirects=False)
+            resp.close()
+            ok.append(True)
+        except Exception:
+            pass
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout * 2)
+    return len(ok)
+
+
+def warm_up_session(session, pool_size=4, timeout=5):
+    """
+    预热session：解析域名、挂载连接池、建立 pool_size 条连接
+    :param session: 会话对象
+    :param pool_size: 要保持的连接数，0 表示不预热
+    :param timeout: 建立连接的超时时间（秒）
+    :return: 成功建立的连接数
+    """
+    if not session or pool_size <= 0:
+        return 0
+    addresses = resolve_host()
+    if addresses:
+        print(f"[预热] {eportal.HOST} -> {', '.join(addresses)}")
+    mount_pool(session, pool_size)
+    opened = open_connections(session, pool_size, timeout)
+    print(f"[预热] 已建立 {opened}/{pool_size} 条连接")
+    return opened
+
+
+def wait_until_warm(session, target_time, pool_size=4, lead=3.0, wait=wait_until):
+    """
+    等待到 target_time，并在开始前 lead 秒刷新一次连接池
+    防止连接在长时间等待中被服务器当作空闲连接关闭
+    :param wait: 实际执行等待的函数，签名为 wait(target_time)
+    """
+    refresh_time = target_time - datetime.timedelta(seconds=lead)
+    if pool_size > 0 and datetime.datetime.now() < refresh_time:
+        wait(refresh_time)
+        print()
+        opened = open_connections(session, pool_size)
+        print(f"[预热] 开始前刷新连接 {opened}/{pool_size}")
+    wait(target_time)
@@ -0,0 +1,558 @@
+import requests
+import time
+import datetime
+import socket
+import json
+import logging
+import os
+from urllib.parse import urlencode, urlsplit
+
+from rate_control import fixed_pacer, response_kind
+from log_queue import progress, log_launch
+
+log = logging.getLogger('eportal')
+
+# 预约系统地址，所有请求都基于这里拼接；可用环境变量 EPORTAL_BASE_URL 指向本地模拟服务器
+BASE_URL = os.environ.get("EPORTAL_BASE_URL", "https://eportal.hnu.edu.cn").rstrip('/')
+HOST = urlsplit(BASE_URL).hostname
+PORT = urlsplit(BASE_URL).port or (443 if BASE_URL.startswith('https') else 80)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+
+# 服务器返回这些错误时继续重试
+RETRYABLE_ERRORS = ["参数错误", "预约日期未达到", "点击太频繁了", "同一时间段不可重复预约", "系统繁忙", "网络错误"]
+
+# 错误信息中包含这些关键字时，说明该场地已经被别人约走，应换下一个候选场地
+SLOT_TAKEN_KEYWORDS = ["已被预约", "已约满", "已预约满", "余量不足", "已被占用", "库存不足"]
+
+
+def set_base_url(base_url):
+    """切换预约系统地址（例如指向 mock_eportal.py 启动的本地服务器）"""
+    global BASE_URL, HOST, PORT
+    BASE_URL = base_url.rstrip('/')
+    HOST = urlsplit(BASE_URL).hostname
+    PORT = urlsplit(BASE_URL).port or (443 if BASE_URL.startswith('https') else 80)
+
+
+def eportal_url(path):
+    """拼接完整地址，path 以 / 开头"""
+    return f"{BASE_URL}{path}"
+
+
+def page_headers():
+    """访问普通页面时使用的请求头"""
+    return {
+        "User-Agent": USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Connection": "keep-alive"
+    }
+
+
+def launch_headers(resource_id):
+    """提交预约（launch）时使用的请求头"""
+    return {
+        "User-Agent": USER_AGENT,
+        "Accept": "application/json, text/plain, */*",
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Origin": BASE_URL,
+        "Referer": eportal_url(f"/v2/reserve/reserveDetail?id={resource_id}"),
+        "Connection": "keep-alive"
+    }
+
+
+def build_launch_data(resource_id, reservations):
+    """构造提交预约的表单"""
+    return {
+        "resource_id": resource_id,
+        "code": "",
+        "remarks": "",
+        "deduct_num": "",
+        "data": json.dumps(reservations)
+    }
+
+
+def encode_launch_body(resource_id, reservations):
+    """把提交预约的表单预先编码成 application/x-www-form-urlencoded 字符串，重试时直接复用"""
+    return urlencode(build_launch_data(resource_id, reservations))
+
+
+def classify_response(result):
+    """
+    判断一次提交预约的返回结果
+    :param result: launch 接口返回的json
+    :return: 'success'（预约成功）、'retry'（可重试的错误）、'taken'（场地已被约走）或 'error'（其他错误）
+    """
+    if result.get('e') == 0:
+        return 'success'
+    error_msg = result.get('m', '未知错误')
+    if error_msg in RETRYABLE_ERRORS:
+        return 'retry'
+    if any(keyword in error_msg for keyword in SLOT_TAKEN_KEYWORDS):
+        return 'taken'
+    return 'error'
+
+
+def open_reservation_pages(session, resource_id):
+    """提交前先访问大厅和详情页，和浏览器的访问顺序保持一致"""
+    session.get(eportal_url("/v2/reserve/hallView?id=10"), headers=page_headers())
+    session.get(eportal_url(f"/v2/reserve/reserveDetail?id={resource_id}"), headers=page_headers())
+
+
+def test_connection():
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect((HOST, PORT))
+        sock.close()
+        return True
+    except:
+        return False
+
+# 读取cookie.txt并返回cookie字典
+def load_cookie_from_file(cookie_file='cookie.txt'):
+    try:
+        with open(cookie_file, 'r', encoding='utf-8') as f:
+            cookie_str = f.read().strip()
+        cookies = {}
+        for item in cookie_str.split(';'):
+            if '=' in item:
+                k, v = item.strip().split('=', 1)
+                cookies[k] = v
+        return cookies
+    except Exception as e:
+        print(f"读取cookie失败: {e}")
+        return None
+
+def save_cookie_to_file(cookies, cookie_file='cookie.txt'):
+    """
+    把cookie按 cookie.txt 的格式（k=v; k=v）写回文件
+    先写临时文件再替换，写到一半退出也不会留下损坏的cookie文件
+    :param cookies: cookie字典
+    """
+    tmp_file = f"{cookie_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write("; ".join(f"{k}={v}" for k, v in cookies.items()))
+    os.replace(tmp_file, cookie_file)
+
+# 用cookie构造session
+def get_session_with_cookie(cookie_file='cookie.txt'):
+    session = requests.Session()
+    cookies = load_cookie_from_file(cookie_file)
+    if not cookies:
+        print("未能加载cookie，无法继续")
+        return None
+    session.cookies.update(cookies)
+    return session
+
+
+def check_session(session):
+    """检查cookie是否有效（尝试访问个人主页）"""
+    resp = session.get(eportal_url("/v2/site/index"))
+    if '登录' in resp.text or resp.url.startswith('http://cas.hnu.edu.cn'):
+        return False
+    return True
+
+
+def late_success(launcher, timeout=0):
+    """
+    对冲提交（hedge.HedgedSender）返回之后才回复成功的请求，提交循环结束前确认一次
+    :param timeout: 还有请求在途时最多等待多久（秒）
+    :return: 成功的回复；没有或 launcher 不是对冲提交时返回 None
+    """
+    check = getattr(launcher, 'late_success', None)
+    return check(timeout) if check else None
+
+
+def make_reservation(session, reservations, resource_id, max_attempts=1000, retry_delay=0.1, request_timeout=10, pacer=None,
+                     payload=None, open_pages=True, launcher=None, on_response=None):
+    """
+    进行预约，支持重试机制
+    :param session: 会话对象
+    :param reservations: 预约信息列表
+    :param resource_id: 资源ID
+    :param max_attempts: 最大尝试次数
+    :param retry_delay: 重试间隔（秒）
+    :param pacer: 可选，rate_control.AdaptivePacer，按错误类型调整重试间隔；不传时固定为 retry_delay
+    :param payload: 可选，encode_launch_body 预先编码好的表单，传入时不再重新构造
+    :param open_pages: 是否先访问大厅和详情页（已经访问过时可以跳过）
+    :param launcher: 可选，fast_send.FastLauncher，传入时用预先编码好的请求提交（第0个候选）
+    :param on_response: 可选，每收到一个响应调用 on_response(result, 发出时间戳, 收到时间戳)，例如 ReleaseProfiler.observe
+    :return: 是否预约成功
+    """
+    if not session:
+        print("未登录，无法进行预约")
+        return False
+    if pacer is None:
+        pacer = fixed_pacer(retry_delay)
+    progress_key = object()
+
+    try:
+        if open_pages:
+            open_reservation_pages(session, resource_id)
+
+        reserve_url = eportal_url("/site/reservation/launch")
+        reserve_headers = launch_headers(resource_id)
+        data = payload if payload is not None else build_launch_data(resource_id, reservations)
+
+        attempt_count = 0
+        start_time = datetime.datetime.now()
+
+        while attempt_count < max_attempts:
+            attempt_count += 1
+            current_time = datetime.datetime.now()
+            elapsed_time = (current_time - start_time).total_seconds()
+
+            # 进度由后台线程节流输出，这里不做终端I/O
+            progress.update(progress_key, f"尝试第 {attempt_count} 次预约，已用时 {elapsed_time:.1f}秒")
+
+            sent_at = time.time()
+            try:
+                if launcher:
+                    result = launcher.send(0, request_timeout)
+                else:
+                    response = session.post(reserve_url, headers=reserve_headers, data=data, timeout=request_timeout)
+                    result = response.json()
+                if on_response:
+                    on_response(result, sent_at, time.time())
+
+                status = classify_response(result)
+                log_launch(log, response_kind(result), sent_at, attempt=attempt_count, candidate=0)
+                if status == 'success':
+                    pacer.record('success')
+                    progress.finish(progress_key)
+                    print(f"预约成功！预约ID：{result['d']['appointment_id']}")
+                    return True
+                # 对于可重试的错误，继续尝试
+                if status == 'retry':
+                    time.sleep(pacer.next_delay(response_kind(result)))
+                    continue
+                # 对于不可重试的错误，记录但继续尝试
+                log.warning("[警告] 预约失败：%s，继续尝试...", result.get('m', '未知错误'))
+                time.sleep(pacer.next_delay(status))
+                continue
+
+            except requests.exceptions.Timeout:
+                log_launch(log, 'timeout', sent_at, attempt=attempt_count, candidate=0)
+                log.warning("[警告] 请求超时，继续尝试...")
+                time.sleep(pacer.next_delay('timeout'))
+                continue
+            except requests.exceptions.ConnectionError:
+                log_launch(log, 'connection_error', sent_at, attempt=attempt_count, candidate=0)
+                log.warning("[警告] 连接错误，继续尝试...")
+                time.sleep(pacer.next_delay('connection_error'))
+                continue
+            except json.JSONDecodeError:
+                log_launch(log, 'bad_response', sent_at, attempt=attempt_count, candidate=0)
+                log.warning("[警告] 响应解析错误，继续尝试...")
+                time.sleep(pacer.next_delay('bad_response'))
+                continue
+            except Exception as e:
+                log_launch(log, 'exception', sent_at, attempt=attempt_count, candidate=0)
+                log.warning("[警告] 请求异常：%s，继续尝试...", e)
+                time.sleep(pacer.next_delay('exception'))
+                continue
+
+        progress.finish(progress_key)
+        result = late_success(launcher, request_timeout)
+        if result:
+            print(f"预约成功！预约ID：{result['d']['appointment_id']}（之前在途的请求）")
+            return True
+        print(f"达到最大尝试次数（{max_attempts}次），预约失败")
+        return False
+
+    except Exception as e:
+        progress.finish(progress_key)
+        print(f"预约请求初始化失败：{str(e)}")
+        return False
+
+def make_reservation_candidates(session, candidates, resource_id, max_attempts=1000, retry_delay=0.1, request_timeout=10,
+                                is_available=None, pacer=None, payloads=None, open_pages=True, launcher=None,
+                                on_response=None):
+    """
+    按优先级依次尝试多个候选场地，服务器提示场地已被约走时立即换下一个候选
+    每次都选择排名最靠前、没有被服务器告知约走、并且 is_available 认为空着的候选；
+    is_available 只作参考，它认为全部约满时仍然提交排名最靠前的没有被约走的候选
+    :param session: 会话对象
+    :param candidates: 候选列表，每个候选是一个预约信息列表（与 make_reservation 的 reservations 相同）
+    :param resource_id: 资源ID
+    :param max_attempts: 所有候选合计的最大尝试次数
+    :param retry_delay: 重试间隔（秒）
+    :param request_timeout: 单次请求超时时间（秒）
+    :param is_available: 可选，判断候选当前是否空着的函数，例如 AvailabilityPoller.candidate_available
+    :param pacer: 可选，rate_control.AdaptivePacer，按错误类型调整重试间隔；不传时固定为 retry_delay
+    :param payloads: 可选，与 candidates 一一对应的预先编码好的表单
+    :param open_pages: 是否先访问大厅和详情页（已经访问过时可以跳过）
+    :param launcher: 可选，fast_send.FastLauncher，候选顺序与 candidates 相同，传入时用预先编码好的请求提交
+    :param on_response: 可选，每收到一个响应调用 on_response(result, 发出时间戳, 收到时间戳)
+    :return: 是否预约成功
+    """
+    if not session:
+        print("未登录，无法进行预约")
+        return False
+    if pacer is None:
+        pacer = fixed_pacer(retry_delay)
+    if not candidates:
+        print("没有可用的候选场地")
+        return False
+    progress_key = object()
+
+    try:
+        if open_pages:
+            open_reservation_pages(session, resource_id)
+
+        reserve_url = eportal_url("/site/reservation/launch")
+        reserve_headers = launch_headers(resource_id)
+        # 预先构造好每个候选的表单，换候选时不再重新序列化
+        if payloads is None:
+            payloads = [encode_launch_body(resource_id, reservations) for reservations in candidates]
+        taken = set()
+
+        def next_candidate():
+            remaining = [i for i in range(len(candidates)) if i not in taken]
+            if not remaining:
+                return None
+            if is_available is not None:
+                for i in remaining:
+                    if is_available(candidates[i]):
+                        return i
+            return remaining[0]
+
+        attempt_count = 0
+        start_time = datetime.datetime.now()
+
+        while attempt_count < max_attempts:
+            current = next_candidate()
+            if current is None:
+                progress.finish(progress_key)
+                result = late_success(launcher, request_timeout)
+                if result:
+                    print(f"预约成功！预约ID：{result['d']['appointment_id']}（之前在途的请求）")
+                    return True
+                print("所有候选场地都已被预约，预约失败")
+                return False
+            attempt_count += 1
+            elapsed_time = (datetime.datetime.now() - start_time).total_seconds()
+
+            progress.update(progress_key, f"尝试第 {attempt_count} 次预约（候选 {current + 1}/{len(candidates)}），已用时 {elapsed_time:.1f}秒")
+
+            sent_at = time.time()
+            try:
+                if launcher:
+                    result = launcher.send(current, request_timeout)
+                else:
+                    response = session.post(reserve_url, headers=reserve_headers, data=payloads[current], timeout=request_timeout)
+                    result = response.json()
+                if on_response:
+                    on_response(result, sent_at, time.time())
+
+                status = classify_response(result)
+                kind = response_kind(result)
+                log_launch(log, kind, sent_at, attempt=attempt_count, candidate=current)
+                if status == 'success':
+                    pacer.record('success')
+                    progress.finish(progress_key)
+                    print(f"预约成功！预约ID：{result['d']['appointment_id']}，候选 {current + 1}：{candidates[current]}")
+                    return True
+                if status == 'taken':
+                    # 场地已被约走，不等待，直接提交下一个候选
+                    pacer.record('taken')
+                    log.warning("[提示] 候选 %d 已被预约：%s", current + 1, result.get('m'))
+                    taken.add(current)
+                    continue
+                if status != 'retry':
+                    log.warning("[警告] 预约失败：%s，继续尝试...", result.get('m', '未知错误'))
+            except requests.exceptions.Timeout:
+                log.warning("[警告] 请求超时，继续尝试...")
+                kind = 'timeout'
+                log_launch(log, kind, sent_at, attempt=attempt_count, candidate=current)
+            except requests.exceptions.ConnectionError:
+                log.warning("[警告] 连接错误，继续尝试...")
+                kind = 'connection_error'
+                log_launch(log, kind, sent_at, attempt=attempt_count, candidate=current)
+            except json.JSONDecodeError:
+                log.warning("[警告] 响应解析错误，继续尝试...")
+                kind = 'bad_response'
+                log_launch(log, kind, sent_at, attempt=attempt_count, candidate=current)
+            except Exception as e:
+                log.warning("[警告] 请求异常：%s，继续尝试...", e)
+                kind = 'exception'
+                log_launch(log, kind, sent_at, attempt=attempt_count, candidate=current)
+            time.sleep(pacer.next_delay(kind))
+
+        progress.finish(progress_key)
+        result = late_success(launcher, request_timeout)
+        if result:
+            print(f"预约成功！预约ID：{result['d']['appointment_id']}（之前在途的请求）")
+            return True
+        print(f"达到最大尝试次数（{max_attempts}次），预约失败")
+        return False
+
+    except Exception as e:
+        progress.finish(progress_key)
+        print(f"预约请求初始化失败：{str(e)}")
+        return False
+
+def parse_time(time_str):
+    try:
+        target_time = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+        return target_time
+    except ValueError:
+        print("时间格式错误，请使用 'YYYY-MM-DD HH:MM:SS' 格式")
+        return None
+
+def wait_until(target_time):
+    while True:
+        current_time = datetime.datetime.now()
+        if current_time >= target_time:
+            return
+        time_diff = (target_time - current_time).total_seconds()
+        if time_diff > 0:
+            print(f"\r距离预约开始还有: {time_diff:.1f}秒", end="")
+            time.sleep(0.1)
+
+def load_config(config_file='config.json'):
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+            return config
+    except FileNotFoundError:
+        print(f"错误：配置文件 {config_file} 不存在")
+        return {}
+    except json.JSONDecodeError:
+        print("错误：配置文件格式不正确")
+        return {}
+    except Exception as e:
+        print(f"读取配置文件时发生错误：{str(e)}")
+        return {}
+
+def fetch_margin(session, resource_id, date):
+    """拉取 resource-info-margin 接口的原始数据（返回json里的 d 字段）"""
+    url = eportal_url(f"/site/reservation/resource-info-margin?resource_id={resource_id}&start_time={date}&end_time={date}")
+    headers = {
+        "User-Agent": USER_AGENT,
+        "Accept": "application/json, text/plain, */*",
+        "Referer": eportal_url(f"/v2/reserve/reserveDetail?id={resource_id}"),
+        "Connection": "keep-alive"
+    }
+    resp = session.get(url, headers=headers, verify=False)
+    data = resp.json()
+    return data['d']
+
+def parse_margin_layout(d):
+    """
+    把 margin 数据整理成场地布局：
+    base_time_id、base_sub_id、yaxis（时间段列表）、abscissa（台号列表），
+    以及 slots：每个 [yaxis, abscissa, time_id, sub_id] 记录，用于精确查找ID
+    只保留每种不同的时间段一次，台号遍历所有key下所有台号
+    """
+    # 只用第一个台号的时间段，且只显示每种时间段一次
+    first_key = list(d.keys())[0]
+    time_list = d[first_key]
+    yaxis = []
+    last_yaxis = None
+    for t in time_list:
+        if t['yaxis'] != last_yaxis:
+            yaxis.append(t['yaxis'])
+            last_yaxis = t['yaxis']
+    base_time_id = time_list[0]['time_id']
+    # 台号列表，遍历所有key下所有台号，去重
+    abscissa = []
+    abscissa_set = set()
+    base_sub_id = None
+    slots = []
+    for vlist in d.values():
+        for v in vlist:
+            slots.append([v['yaxis'], v['abscissa'], v['time_id'], v['sub_id']])
+            if v['abscissa'] not in abscissa_set:
+                abscissa.append(v['abscissa'])
+                abscissa_set.add(v['abscissa'])
+                if base_sub_id is None:
+                    base_sub_id = v['sub_id']
+    return {
+        "base_time_id": base_time_id,
+        "base_sub_id": base_sub_id,
+        "yaxis": yaxis,
+        "abscissa": abscissa,
+        "slots": slots,
+    }
+
+def fetch_margin_layout(session, resource_id, date):
+    """拉取并解析场地布局，见 parse_margin_layout"""
+    return parse_margin_layout(fetch_margin(session, resource_id, date))
+
+def layout_options(layout):
+    """由场地布局得到 (time_options, table_options, base_time_id, base_sub_id)"""
+    time_options = list(enumerate(layout['yaxis']))
+    table_options = list(enumerate(layout['abscissa']))
+    return time_options, table_options, layout['base_time_id'], layout['base_sub_id']
+
+def slot_index(layout):
+    """由场地布局建立索引：{(yaxis, abscissa): (time_id, sub_id)}"""
+    return {(y, a): (time_id, sub_id) for y, a, time_id, sub_id in layout['slots']}
+
+def lookup_slot(layout, t_idx, s_idx, index=None):
+    """
+    按时间段序号和台号序号查出真实的 (period, sub_resource_id)
+    不再用 base_time_id + t_idx 这类算术推测，组合不存在时抛出 ValueError
+    """
+    if index is None:
+        index = slot_index(layout)
+    if not 0 <= t_idx < len(layout['yaxis']) or not 0 <= s_idx < len(layout['abscissa']):
+        raise ValueError(f"序号超出范围：时间段 {t_idx}，台号 {s_idx}")
+    key = (layout['yaxis'][t_idx], layout['abscissa'][s_idx])
+    if key not in index:
+        raise ValueError(f"场地数据中没有 {key[0]} {key[1]} 这个组合")
+    return index[key]
+
+def build_reservations(layout, date, t_indices, s_idx, index=None):
+    """按时间段序号列表和台号序号生成预约信息列表（连续多个时间段预约同一个台）"""
+    reservations = []
+    for t_idx in t_indices:
+        period, sub_resource_id = lookup_slot(layout, t_idx, s_idx, index)
+        reservations.append({"date": date, "period": period, "sub_resource_id": sub_resource_id})
+    return reservations
+
+def fallback_table_order(layout, s_idx, fallback_tables):
+    """
+    候选台号顺序：首选台号在前，之后按 fallback_tables 排列
+    :param fallback_tables: 台号名称列表（与 abscissa 一致），或 "all" 表示其余全部台号
+    :return: 台号序号列表
+    """
+    order = [s_idx]
+    if fallback_tables == "all":
+        names = layout['abscissa']
+    else:
+        names = fallback_tables or []
+    for name in names:
+        if name in layout['abscissa']:
+            idx = layout['abscissa'].index(name)
+            if idx not in order:
+                order.append(idx)
+        else:
+            print(f"[警告] 候选台号 {name} 不在场地数据中，已忽略")
+    return order
+
+def build_candidates(layout, date, t_indices, table_order):
+    """
+    按台号优先顺序生成候选列表，场地数据中不存在的组合会被跳过
+    :return: 候选列表，每个候选是一个预约信息列表
+    """
+    index = slot_index(layout)
+    candidates = []
+    for s_idx in table_order:
+        try:
+            candidates.append(build_reservations(layout, date, t_indices, s_idx, index))
+        except ValueError:
+            continue
+    return candidates
+
+def fetch_time_and_table_options(session, resource_id, date):
+    """
+    拉取可预约时间段和台号，返回基础time_id、sub_id和展示列表
+    只展示每种不同的时间段一次，台号遍历所有key下所有台号
+    """
+    return layout_options(fetch_margin_layout(session, resource_id, date))
@@ -0,0 +1,106 @@
+"""
+预先编码的提交请求
+
+session.post 每次都要合并请求头、编码表单（包括 json.dumps 之后的 data 字段）、
+生成新的 PreparedRequest 并经过一遍适配器。抢场时一个任务要提交成百上千次，
+这些开销全部是重复的。FastLauncher 在开始前把每个候选的请求头和表单编码成 bytes，
+之后每次提交只是把同一份 bytes 交给连接池里已经建立好的连接。
+
+注意：这条路径不经过 requests 的代理设置，服务器通过 Set-Cookie 更新cookie时会重新生成请求头。
+"""
+import json
+import time
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import requests
+from requests.cookies import extract_cookies_to_jar
+from urllib3.exceptions import HTTPError, TimeoutError as Urllib3TimeoutError
+from urllib3.util import Timeout
+
+from eportal import eportal_url, launch_headers
+from metrics import start_phases
+
+
+class FastLauncher:
+    """
+    用预先编码好的请求提交预约
+    :param session: 会话对象（最好已经用 connection_pool.warm_up_session 预热）
+    :param resource_id: 资源ID
+    :param payloads: 每个候选编码好的表单（eportal.encode_launch_body 的结果）
+    """
+
+    def __init__(self, session, resource_id, payloads):
+        self.session = session
+        self.resource_id = resource_id
+        self.payloads = payloads
+        self.url = eportal_url("/site/reservation/launch")
+        self.path = urlsplit(self.url).path
+        self._timeouts = {}
+        self._prepare()
+
+    def _prepare(self):
+        """按 session 当前的请求头和cookie，把每个候选的请求编码成 (请求头, 请求体)"""
+        self.requests = []
+        for payload in self.payloads:
+            request = self.session.prepare_request(requests.Request(
+                'POST', self.url, headers=launch_headers(self.resource_id), data=payload))
+            body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+            request.headers['Content-Length'] = str(len(body))
+            self.requests.append((request, dict(request.headers), body))
+        request = self.requests[0][0]
+        adapter = self.session.get_adapter(self.url)
+        self.recorder = getattr(adapter, 'recorder', None)
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            self.pool = adapter.get_connection_with_tls_context(request, self.session.verify, cert=self.session.cert)
+        else:
+            self.pool = adapter.get_connection(self.url)
+
+    def _timeout(self, request_timeout):
+        timeout = self._timeouts.get(request_timeout)
+        if timeout is None:
+            timeout = self._timeouts[request_timeout] = Timeout(connect=request_timeout, read=request_timeout)
+        return timeout
+
+    def send(self, index, request_timeout=10):
+        """
+        提交第 index 个候选
+        :return: 服务器返回的json
+        :raises requests.exceptions.Timeout: 请求超时
+        :raises requests.exceptions.ConnectionError: 连接错误
+        """
+        request, headers, body = self.requests[index]
+        response = ttfb = None
+        # 连接池来自 InstrumentedAdapter 时，新建连接的各阶段耗时记在 phases 里
+        phases = start_phases() if self.recorder is not None else None
+        t0 = time.perf_counter()
+        try:
+            # 先只等响应头，记下首字节时间，再读响应体
+            response = self.pool.urlopen('POST', self.path, body=body, headers=headers, retries=False, redirect=False,
+                                         assert_same_host=False, timeout=self._timeout(request_timeout),
+                                         preload_content=False)
+            ttfb = time.perf_counter() - t0
+            data = response.data
+        except Urllib3TimeoutError as e:
+            self._record(t0, phases, ttfb=ttfb, error='Timeout')
+            raise requests.exceptions.Timeout(e)
+        except HTTPError as e:
+            self._record(t0, phases, ttfb=ttfb, error='ConnectionError')
+            raise requests.exceptions.ConnectionError(e)
+        finally:
+            if response is not None:
+                response.release_conn()
+
+        if response.headers.get('Set-Cookie'):
+            extract_cookies_to_jar(self.session.cookies, request, response)
+            self._prepare()
+        result = json.loads(data)
+        message = result.get('m') if isinstance(result, dict) and result.get('e') not in (0, None) else None
+        self._record(t0, phases, ttfb=ttfb, status=response.status, message=message)
+        return result
+
+    def _record(self, t0, phases, **kwargs):
+        """会话开启了耗时统计（metrics.InstrumentedAdapter）时同样记录，包括新建连接的 DNS/连接/TLS 耗时"""
+        if self.recorder is not None:
+            elapsed = time.perf_counter() - t0
+            self.recorder.record(SimpleNamespace(method='POST', url=self.url), phases, total=elapsed, **kwargs)
@@ -0,0 +1,210 @@
+"""
+对冲提交（hedged request）
+
+一次 session.post 最长要等 request_timeout 秒，某一条 TCP 连接卡住时整个重试循环都被拖住。
+对冲提交先发一个请求，超过 hedge_delay 还没有回复就在另一条连接上再发一个，
+最多同时 hedge_requests 个，取第一个明确的回复（服务器返回的任何json）立即返回。
+其他还在途的请求不取消，之后回复成功时记下来：下一次 send 直接返回这个成功，
+提交循环结束前也会用 late_success 再确认一次，已经约上的请求不会被丢掉。
+同一个账号的所有任务共用一个并发上限 account_concurrency 和一个线程池，对冲不会让请求速度超出
+「点击太频繁了」的阈值，每次重试新建的 HedgedSender 也不会各自留下一批线程；
+没有回复的请求不会被取消，但在结束前一直占着名额。
+对冲等待时间取最近回复耗时中位数的 HEDGE_DELAY_FACTOR 倍，最多 hedge_delay：
+卡顿的请求本身也在样本里，用 p95 的话卡顿一多，等待时间就会涨到卡顿时长，对冲不再触发。
+"""
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from eportal import classify_response, eportal_url, launch_headers
+from fast_send import FastLauncher
+from metrics import percentile
+
+# 对冲等待时间为最近回复耗时中位数的倍数
+HEDGE_DELAY_FACTOR = 2
+
+# 每个账号（session）的并发名额和线程池
+_limiters = weakref.WeakKeyDictionary()
+_executors = weakref.WeakKeyDictionary()
+_limiters_lock = threading.Lock()
+
+
+def account_limiter(session, limit):
+    """同一个session的所有对冲提交共用的并发名额"""
+    with _limiters_lock:
+        limiter = _limiters.get(session)
+        if limiter is None:
+            limiter = _limiters[session] = threading.BoundedSemaphore(limit)
+        return limiter
+
+
+def account_executor(session, workers):
+    """
+    同一个session的所有对冲提交共用的线程池
+    session 被回收时线程池随之释放，空闲的线程自动退出
+    """
+    with _limiters_lock:
+        executor = _executors.get(session)
+        if executor is None:
+            executor = _executors[session] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+        return executor
+
+
+class PostSender:
+    """用 session.post 提交编码好的表单，接口与 fast_send.FastLauncher 相同"""
+
+    def __init__(self, session, resource_id, payloads):
+        self.session = session
+        self.url = eportal_url("/site/reservation/launch")
+        self.headers = launch_headers(resource_id)
+        self.payloads = payloads
+
+    def send(self, index, request_timeout=10):
+        response = self.session.post(self.url, headers=self.headers, data=self.payloads[index], timeout=request_timeout)
+        return response.json()
+
+
+class HedgedSender:
+    """
+    对冲提交，接口与 fast_send.FastLauncher 相同，可以直接作为 make_reservation 的 launcher
+    :param sender: 实际提交的对象（FastLauncher 或 PostSender），需要线程安全
+    :param session: 账号的会话对象，用来共用并发名额
+    :param hedge_requests: 同一次提交最多同时在途的请求数
+    :param hedge_delay: 多久没有回复就发出下一个请求（秒），有足够耗时样本后按中位数缩短
+    :param account_concurrency: 同一个账号最多同时在途的请求数
+    """
+
+    def __init__(self, sender, session, hedge_requests=2, hedge_delay=0.1, account_concurrency=2):
+        self.sender = sender
+        self.hedge_requests = max(1, hedge_requests)
+        self.hedge_delay = hedge_delay
+        self.limiter = account_limiter(session, max(1, account_concurrency))
+        # 还没回复的请求会继续占用线程，线程数按两个上限中较大的一个
+        self.executor = account_executor(session, max(self.hedge_requests, account_concurrency))
+        self.latencies = deque(maxlen=50)
+        self.hedged = 0
+        self.wins = 0
+        # 已经返回、但还有请求在途时，这些请求之后回复的成功
+        self._abandoned = set()
+        self._late = deque()
+        self._lock = threading.Lock()
+
+    def current_delay(self):
+        """最近回复耗时中位数的 HEDGE_DELAY_FACTOR 倍，不超过 hedge_delay；样本不足时用 hedge_delay"""
+        if len(self.latencies) < 10:
+            return self.hedge_delay
+        return min(self.hedge_delay, percentile(list(self.latencies), 50) * HEDGE_DELAY_FACTOR)
+
+    def _abandon(self, futures):
+        """send 已经返回，剩下的请求继续在后台执行，回复成功时记下来"""
+        with self._lock:
+            self._abandoned.update(futures)
+        for future in futures:
+            future.add_done_callback(self._on_abandoned_done)
+
+    def _on_abandoned_done(self, future):
+        with self._lock:
+            self._abandoned.discard(future)
+            if future.exception() is None and classify_response(future.result()) == 'success':
+                self._late.append(future.result())
+
+    def late_success(self, timeout=0):
+        """
+        之前的 send 返回之后才回复成功的请求
+        :param timeout: 还有请求在途时最多等待多久（秒）
+        :return: 成功的回复，没有时返回 None
+        """
+        with self._lock:
+            abandoned = list(self._abandoned)
+        if abandoned and timeout > 0:
+            wait(abandoned, timeout=timeout)
+        with self._lock:
+            return self._late.popleft() if self._late else None
+
+    def _send(self, index, request_timeout):
+        t0 = time.perf_counter()
+        try:
+            result = self.sender.send(index, request_timeout)
+        finally:
+            self.limiter.release()
+        self.latencies.append(time.perf_counter() - t0)
+        return result
+
+    def send(self, index, request_timeout=10):
+        """
+        提交第 index 个候选，返回第一个明确的回复
+        之前的提交有请求在返回之后才回复成功时，直接返回那个成功，不再提交
+        所有请求都失败时抛出最后一个异常
+        """
+        late = self.late_success()
+        if late is not None:
+            return late
+        # 第一个请求一定要发，名额不够时等待
+        self.limiter.acquire()
+        first = self.executor.submit(self._send, index, request_timeout)
+        pending = {first}
+        launched = 1
+        deadline = time.perf_counter() + request_timeout
+        error = None
+        while pending:
+            can_hedge = launched < self.hedge_requests
+            timeout = self.current_delay() if can_hedge else max(0.0, deadline - time.perf_counter())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is not first:
+                    self.wins += 1
+                if pending:
+                    self._abandon(pending)
+                return result
+            if not done and can_hedge and self.limiter.acquire(blocking=False):
+                if launched == 1:
+                    self.hedged += 1
+                future = self.executor.submit(self._send, index, request_timeout)
+                pending.add(future)
+                launched += 1
+            elif not done and not can_hedge and time.perf_counter() >= deadline:
+                break
+        if pending:
+            self._abandon(pending)
+        if error:
+            raise error
+        raise requests.exceptions.Timeout("对冲提交全部超时")
+
+    def stats(self):
+        """触发对冲的次数和后发请求先回复的次数"""
+        return {"hedged": self.hedged, "wins": self.wins, "delay": round(self.current_delay(), 4)}
+
+
+def hedge_options(config):
+    """从配置中取出对冲参数，hedge_requests 不大于1时返回 None（不对冲）"""
+    if config.get('hedge_requests', 1) <= 1:
+        return None
+    return {
+        "hedge_requests": config['hedge_requests'],
+        "hedge_delay": config.get('hedge_delay', 0.1),
+        "account_concurrency": config.get('account_concurrency', config['hedge_requests']),
+    }
+
+
+def build_launcher(session, resource_id, payloads, fast_send=False, hedge=None):
+    """
+    按配置组合提交方式，结果可以作为 make_reservation / make_reservation_candidates 的 launcher
+    :param fast_send: 是否用 fast_send.FastLauncher
+    :param hedge: hedge_options 的结果，None 表示不对冲
+    :return: launcher；既不用 fast_send 也不对冲时返回 None（使用原来的 session.post）
+    """
+    if not fast_send and not hedge:
+        return None
+    sender = FastLauncher(session, resource_id, payloads) if fast_send else PostSender(session, resource_id, payloads)
+    if hedge:
+        return HedgedSender(sender, session, **hedge)
+    return sender
@@ -0,0 +1,317 @@
+"""
+本地场地ID库
+
+仓库里的「场馆resource_id，period,sub_resource_id.xlsx」和 222.xlsx 是手工整理的对照表，
+原来要自己在表里找到 period、sub_resource_id 再抄进 config.json。这里把对照表（以及联网拉取的 margin 数据）
+导入一个 SQLite 文件，按 (resource_id, 日期, 开始时间, 台号) 建主键索引，之后按场馆名、时间和台号直接查出ID，
+查询不联网、不导入 requests。
+
+表格格式与 slot_table.py 导出的相同：表头行是 场馆名+resource_id、period、各台号，
+之后每行是 时间段、period、各台号的 sub_resource_id；一张表里可以有多个场馆，依次排列。
+读取 .xlsx 需要 openpyxl，.csv 不需要额外依赖。
+
+用法：
+    python id_store.py import 场馆resource_id，period,sub_resource_id.xlsx 222.xlsx   # 后导入的覆盖先导入的
+    python id_store.py import-margin --resource_id 57 --date 2025-09-12                # 联网导入某一天的实际ID
+    python id_store.py list
+    python id_store.py resolve --venue 羽毛球馆 --time 19:00 --time 20:00 --court 3号台 --date 2025-09-12
+    python id_store.py resolve --venue 57 --time 19:00 --court 3号台 --update-config config.json
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sqlite3
+
+DEFAULT_STORE_FILE = 'id_store.sqlite3'
+
+# 对照表没有日期，导入时 date 记为空字符串；查询时先查指定日期，再查对照表
+UNDATED = ''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS venues (
+    resource_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slots (
+    resource_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    start TEXT NOT NULL,
+    court TEXT NOT NULL,
+    yaxis TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    sub_resource_id INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (resource_id, date, start, court)
+) WITHOUT ROWID;
+"""
+
+TIME_PATTERN = re.compile(r'(\d{1,2}):(\d{2})')
+TITLE_PATTERN = re.compile(r'^(.*?)(\d+)$')
+
+
+def normalize_time(value):
+    """把 datetime.time、"8:00"、"19:10-20:10" 等统一成开始时间 "HH:MM"，无法识别时返回 None"""
+    if isinstance(value, (datetime.time, datetime.datetime)):
+        return value.strftime("%H:%M")
+    match = TIME_PATTERN.search(str(value or ''))
+    if not match:
+        return None
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+
+def parse_title(title):
+    """把表头第一格 "南校区羽毛球馆57" 拆成 (场馆名, resource_id)"""
+    match = TITLE_PATTERN.match(str(title).strip())
+    if not match:
+        raise ValueError(f"表头应为 场馆名+resource_id：{title}")
+    return match.group(1).strip() or match.group(2), match.group(2)
+
+
+def read_rows(path):
+    """读取 .xlsx 或 .csv 的全部行"""
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            return [[cell or None for cell in row] for row in csv.reader(f)]
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("读取xlsx需要openpyxl，请先执行 pip install openpyxl，或先另存为 .csv")
+    wb = load_workbook(path, read_only=True, data_only=True)
+    rows = []
+    for ws in wb.worksheets:
+        rows.extend(list(row) for row in ws.iter_rows(values_only=True))
+    wb.close()
+    return rows
+
+
+def parse_slot_table(rows):
+    """
+    解析对照表
+    同一场馆表头里重复的台号（例如网球场的 1,2,3,1,2,1,2）加上列号区分，写成 "1（第3列）"，
+    否则按主键导入时会互相覆盖；解析不出任何格子的场馆（例如没有时间段的健身房）输出警告后跳过
+    :return: [(resource_id, 场馆名, 开始时间, 时间段文字, 台号, period, sub_resource_id)]
+    """
+    records = []
+    venue = None
+    courts = []
+    counts = {}
+
+    def check_block():
+        if venue and not counts[venue]:
+            print(f"[警告] 场馆 {venue[0]}{venue[1]} 没有可以解析的时间段和台号，已跳过")
+
+    for row in rows:
+        if not row or all(cell is None for cell in row):
+            continue
+        if len(row) > 1 and row[1] == 'period':
+            check_block()
+            venue = parse_title(row[0])
+            counts.setdefault(venue, 0)
+            labels = [(i, str(c).strip()) for i, c in enumerate(row) if i >= 2 and c is not None]
+            duplicated = {label for _, label in labels if sum(label == other for _, other in labels) > 1}
+            courts = [(i, f"{label}（第{i + 1}列）" if label in duplicated else label) for i, label in labels]
+            continue
+        start = normalize_time(row[0])
+        if not venue or not start or row[1] is None:
+            continue
+        yaxis = row[0].strftime("%H:%M") if isinstance(row[0], datetime.time) else str(row[0]).strip()
+        for i, court in courts:
+            if i < len(row) and row[i] is not None:
+                records.append((venue[1], venue[0], start, yaxis, court, int(row[1]), int(row[i])))
+                counts[venue] += 1
+    check_block()
+    return records
+
+
+class IdStore:
+    """
+    场地ID库，按主键索引查询
+    :param path: SQLite 文件
+    """
+
+    def __init__(self, path=DEFAULT_STORE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _insert(self, venues, rows):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO venues VALUES (?, ?)", venues)
+            self.conn.executemany("INSERT OR REPLACE INTO slots VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def import_table(self, path):
+        """导入对照表，同一场馆、时间、台号的ID以后导入的为准；返回导入的格子数"""
+        records = parse_slot_table(read_rows(path))
+        source = os.path.basename(path)
+        venues = {(rid, name) for rid, name, *_ in records}
+        rows = [(rid, UNDATED, start, court, yaxis, period, sub_id, source)
+                for rid, _, start, yaxis, court, period, sub_id in records]
+        self._insert(venues, rows)
+        return len(rows)
+
+    def import_layout(self, resource_id, date, layout, name=None):
+        """导入某一天的场地布局（见 eportal.parse_margin_layout），返回导入的格子数"""
+        rows = [(str(resource_id), date, normalize_time(yaxis), abscissa, yaxis, int(time_id), int(sub_id), 'margin')
+                for yaxis, abscissa, time_id, sub_id in layout['slots'] if normalize_time(yaxis)]
+        existing = self.conn.execute("SELECT name FROM venues WHERE resource_id = ?", (str(resource_id),)).fetchone()
+        self._insert([(str(resource_id), name or (existing[0] if existing else str(resource_id)))], rows)
+        return len(rows)
+
+    def find_venue(self, venue):
+        """
+        按 resource_id 或场馆名（包含即可）找到 resource_id
+        :raises ValueError: 没有找到或匹配到多个场馆
+        """
+        venue = str(venue).strip()
+        row = self.conn.execute("SELECT resource_id FROM venues WHERE resource_id = ? OR name = ?",
+                                (venue, venue)).fetchone()
+        if row:
+            return row[0]
+        matched = [(rid, name) for rid, name in self.conn.execute("SELECT resource_id, name FROM venues")
+                   if venue in name or venue in name + rid]
+        if len(matched) == 1:
+            return matched[0][0]
+        if not matched:
+            raise ValueError(f"ID库中没有场馆：{venue}")
+        raise ValueError(f"场馆 {venue} 匹配到多个：{', '.join(n + r for r, n in matched)}")
+
+    def courts(self, resource_id, date=None):
+        """场馆的全部台号（当天的 margin 数据和对照表）"""
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT court FROM slots WHERE resource_id = ? AND date IN (?, ?)", (resource_id, date or UNDATED, UNDATED))]
+
+    def lookup(self, resource_id, start, court, date=None):
+        """
+        按主键查一个格子，指定日期时先查当天导入的 margin 数据，再查对照表
+        :return: dict 或 None
+        """
+        for d in ((date, UNDATED) if date else (UNDATED,)):
+            row = self.conn.execute(
+                "SELECT yaxis, period, sub_resource_id, source FROM slots "
+                "WHERE resource_id = ? AND date = ? AND start = ? AND court = ?", (resource_id, d, start, court)).fetchone()
+            if row:
+                return {"resource_id": resource_id, "date": d, "start": start, "court": court,
+                        "yaxis": row[0], "period": row[1], "sub_resource_id": row[2], "source": row[3]}
+        return None
+
+    def _starts_within_hour(self, resource_id, start, date=None):
+        """找到 start 之后一小时内最早的开始时间"""
+        end = f"{int(start[:2]) + 1:02d}{start[2:]}"
+        row = self.conn.execute("SELECT MIN(start) FROM slots WHERE resource_id = ? AND date IN (?, ?) AND start >= ? AND start < ?",
+                                (resource_id, date or UNDATED, UNDATED, start, end)).fetchone()
+        return row[0]
+
+    def resolve(self, venue, times, court, date=None):
+        """
+        把「场馆、时间、台号」解析成ID
+        :param times: 开始时间列表，例如 ["19:00", "20:00"]；没有整点开始的时间段时匹配这一小时内开始的
+        :param court: 台号名称，与表格完全一致或包含在其中（"3号" 匹配 "3号台"）
+        :return: (resource_id, [lookup 的结果, ...])
+        :raises ValueError: 场馆、台号或时间段不存在
+        """
+        resource_id = self.find_venue(venue)
+        courts = self.courts(resource_id, date)
+        if court not in courts:
+            matched = [c for c in courts if court in c]
+            if len(matched) != 1:
+                raise ValueError(f"台号 {court} 不存在或不唯一，可选：{', '.join(courts)}")
+            court = matched[0]
+        slots = []
+        for text in times:
+            start = normalize_time(text)
+            slot = self.lookup(resource_id, start, court, date) if start else None
+            if not slot and start:
+                # 时间段不是整点开始时（例如 19:10-20:10），19:00 匹配这一小时内开始的时间段
+                nearby = self._starts_within_hour(resource_id, start, date)
+                slot = self.lookup(resource_id, nearby, court, date) if nearby else None
+            if not slot:
+                raise ValueError(f"ID库中没有 {resource_id} {court} {text} 的记录")
+            slots.append(slot)
+        return resource_id, slots
+
+    def summary(self):
+        """每个场馆的 (resource_id, 场馆名, 日期, 格子数)"""
+        return self.conn.execute(
+            "SELECT v.resource_id, v.name, s.date, COUNT(*) FROM slots s JOIN venues v USING (resource_id) "
+            "GROUP BY v.resource_id, s.date ORDER BY CAST(v.resource_id AS INTEGER), s.date").fetchall()
+
+
+def update_config(config_file, resource_id, slots, date=None):
+    """把解析出的ID写进 config.json（resource_id、slots、period1/sub_resource_id1...）"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    config['resource_id'] = resource_id
+    config['slots'] = len(slots)
+    if date:
+        config['date'] = date
+    for n, slot in enumerate(slots, 1):
+        config[f'period{n}'] = str(slot['period'])
+        config[f'sub_resource_id{n}'] = str(slot['sub_resource_id'])
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地场地ID库：导入对照表，不联网查询ID')
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE_FILE, help='ID库文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_parser = sub.add_parser('import', help='导入 .xlsx/.csv 对照表，后导入的覆盖先导入的')
+    import_parser.add_argument('files', nargs='+')
+    margin_parser = sub.add_parser('import-margin', help='联网拉取某一天的场地数据并导入')
+    margin_parser.add_argument('--resource_id', type=str, required=True, help='预约资源ID')
+    margin_parser.add_argument('--date', type=str, required=True, help='日期，格式：YYYY-MM-DD')
+    margin_parser.add_argument('--name', type=str, help='场馆名，默认沿用已导入的名称')
+    margin_parser.add_argument('--cookie', type=str, default='cookie.txt', help='cookie文件')
+    sub.add_parser('list', help='列出已导入的场馆')
+    resolve_parser = sub.add_parser('resolve', help='按场馆、时间、台号查ID')
+    resolve_parser.add_argument('--venue', type=str, required=True, help='场馆名（包含即可）或 resource_id')
+    resolve_parser.add_argument('--time', type=str, action='append', required=True, help='开始时间，可以重复指定多个')
+    resolve_parser.add_argument('--court', type=str, required=True, help='台号，例如 3号台')
+    resolve_parser.add_argument('--date', type=str, help='预约日期，导入过当天的 margin 数据时优先使用')
+    resolve_parser.add_argument('--update-config', type=str, metavar='CONFIG', help='把结果写进配置文件')
+    args = parser.parse_args()
+
+    store = IdStore(args.store)
+    try:
+        if args.command == 'import':
+            for path in args.files:
+                print(f"{path}：导入 {store.import_table(path)} 个格子")
+        elif args.command == 'import-margin':
+            from eportal import get_session_with_cookie
+            from margin_cache import get_layout
+            session = get_session_with_cookie(args.cookie)
+            if not session:
+                return
+            layout = get_layout(session, args.resource_id, args.date)
+            print(f"resource {args.resource_id} {args.date}：导入 {store.import_layout(args.resource_id, args.date, layout, args.name)} 个格子")
+        elif args.command == 'list':
+            for resource_id, name, date, count in store.summary():
+                print(f"{resource_id}\t{name}\t{date or '对照表'}\t{count} 个格子")
+        else:
+            try:
+                resource_id, slots = store.resolve(args.venue, args.time, args.court, args.date)
+            except ValueError as e:
+                print(f"错误：{e}")
+                return
+            print(f"resource_id = {resource_id}")
+            for n, slot in enumerate(slots, 1):
+                print(f"period{n} = {slot['period']}, sub_resource_id{n} = {slot['sub_resource_id']}"
+                      f"（{slot['yaxis']} {slot['court']}，来源 {slot['source']}）")
+            if args.update_config:
+                update_config(args.update_config, resource_id, slots, args.date)
+                print(f"已写入 {args.update_config}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+会话保活
+
+cookie.txt 里的 PHPSESSID、cas_ticket 过期后，预约时 check_session 才发现，程序只能退出，
+这一轮开放就错过了。这里在开抢前长时间运行，定期用一个轻量请求访问个人主页：
+- 保持会话活跃，服务器下发新的cookie时原子地写回 cookie 文件
+- 发现cookie失效、cookie将在开抢前过期、或连续多次请求失败时立即提醒，留出重新扫码登录的时间
+
+单独运行（可以同时看多个账号）：
+    python keepalive.py --cookie cookie.txt --cookie b.txt --interval 300 --until "2025-09-12 00:00:00"
+也可以在 try.py 等待开抢期间运行，见 config.json 的 keepalive_interval。
+"""
+import argparse
+import datetime
+import os
+import subprocess
+import threading
+import time
+
+import requests
+from requests.utils import dict_from_cookiejar
+
+from eportal import eportal_url, page_headers, get_session_with_cookie, load_cookie_from_file, save_cookie_to_file, parse_time
+
+
+def print_alert(message):
+    """默认的提醒方式：打印到终端"""
+    print(f"\n[保活][提醒] {message}")
+
+
+def command_alert(command):
+    """
+    返回一个执行外部命令的提醒函数，提醒内容通过环境变量 KEEPALIVE_MESSAGE 传入，
+    例如 --alert-command 'notify-send "$KEEPALIVE_MESSAGE"'
+    """
+    def alert(message):
+        print_alert(message)
+        try:
+            subprocess.run(command, shell=True, timeout=30, env=dict(os.environ, KEEPALIVE_MESSAGE=message))
+        except Exception as e:
+            print(f"[保活] 提醒命令执行失败：{e}")
+    return alert
+
+
+class SessionKeeper(threading.Thread):
+    """
+    在后台定期访问个人主页，保持会话活跃并把更新的cookie写回文件
+    :param session: 会话对象，与预约共用时保活请求也会刷新同一个会话
+    :param cookie_file: cookie文件，cookie有变化时写回
+    :param interval: 两次保活请求的间隔（秒）
+    :param until: 可选，开抢时间（datetime）；cookie会在这之前过期时提前提醒
+    :param alert: 提醒函数 alert(message)，默认打印
+    :param max_failures: 连续多少次网络错误后提醒
+    """
+
+    def __init__(self, session, cookie_file='cookie.txt', interval=300, until=None, alert=None, max_failures=3):
+        super().__init__(daemon=True)
+        self.session = session
+        self.cookie_file = cookie_file
+        self.interval = interval
+        self.until = until
+        self.alert = alert or print_alert
+        self.max_failures = max_failures
+        self.valid = True
+        self.failures = 0
+        self.checks = 0
+        self.last_check = None
+        self._warned_expiry = False
+        self._stop_event = threading.Event()
+
+    def check_once(self):
+        """
+        访问一次个人主页
+        :return: True 表示会话有效，False 表示已失效，None 表示网络错误
+        """
+        self.checks += 1
+        self.last_check = time.time()
+        try:
+            resp = self.session.get(eportal_url("/v2/site/index"), headers=page_headers(), timeout=10)
+        except requests.exceptions.RequestException as e:
+            self.failures += 1
+            print(f"[保活] {self.cookie_file} 请求失败（连续 {self.failures} 次）：{e}")
+            if self.failures == self.max_failures:
+                self.alert(f"{self.cookie_file} 连续 {self.failures} 次无法访问服务器，请检查网络")
+            return None
+        self.failures = 0
+        if '登录' in resp.text or resp.url.startswith('http://cas.hnu.edu.cn'):
+            if self.valid:
+                self.alert(f"{self.cookie_file} 中的cookie已失效，请重新扫码登录并更新cookie")
+            self.valid = False
+            # 重新读取cookie文件，更新过cookie后下一次检查就能恢复，不用重启程序
+            self.session.cookies.update(load_cookie_from_file(self.cookie_file) or {})
+            return False
+        if not self.valid:
+            print(f"[保活] {self.cookie_file} 会话已恢复")
+        self.valid = True
+        self._persist()
+        self._check_expiry()
+        return True
+
+    def _persist(self):
+        """cookie有变化时写回文件"""
+        cookies = dict(load_cookie_from_file(self.cookie_file) or {})
+        current = dict(cookies, **dict_from_cookiejar(self.session.cookies))
+        if current != cookies:
+            save_cookie_to_file(current, self.cookie_file)
+            changed = sorted(k for k in current if cookies.get(k) != current[k])
+            print(f"[保活] {self.cookie_file} 已更新cookie：{', '.join(changed)}")
+
+    def _check_expiry(self):
+        """cookie带有过期时间且会在开抢前过期时提醒一次"""
+        if not self.until or self._warned_expiry:
+            return
+        deadline = self.until.timestamp()
+        expiring = [c.name for c in self.session.cookies if c.expires and c.expires < deadline]
+        if expiring:
+            self._warned_expiry = True
+            self.alert(f"{self.cookie_file} 中的 {', '.join(expiring)} 会在开抢时间 {self.until} 之前过期，请提前重新登录")
+
+    def run(self):
+        # 启动前通常刚检查过，先等一个间隔
+        while not self._stop_event.wait(self.interval):
+            self.check_once()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='定期访问个人主页，保持cookie有效')
+    parser.add_argument('--cookie', action='append', help='cookie文件，可以重复指定多个账号，默认 cookie.txt')
+    parser.add_argument('--interval', type=float, default=300, help='保活请求间隔（秒）')
+    parser.add_argument('--until', type=str, help='开抢时间，格式：YYYY-MM-DD HH:MM:SS，到时间后退出，cookie会在这之前过期时提前提醒')
+    parser.add_argument('--alert-command', type=str, help='提醒时执行的命令，提醒内容在环境变量 KEEPALIVE_MESSAGE 中')
+    args = parser.parse_args()
+
+    until = parse_time(args.until) if args.until else None
+    if args.until and not until:
+        return
+    alert = command_alert(args.alert_command) if args.alert_command else print_alert
+    keepers = []
+    for cookie_file in args.cookie or ['cookie.txt']:
+        session = get_session_with_cookie(cookie_file)
+        if not session:
+            alert(f"{cookie_file} 读取失败")
+            continue
+        keeper = SessionKeeper(session, cookie_file, args.interval, until, alert)
+        print(f"[保活] {cookie_file}：{'有效' if keeper.check_once() else '无效'}")
+        keeper.start()
+        keepers.append(keeper)
+    if not keepers:
+        return
+
+    print(f"[保活] 正在保活 {len(keepers)} 个会话，间隔 {args.interval} 秒，按 Ctrl+C 退出")
+    try:
+        while any(k.is_alive() for k in keepers):
+            if until and datetime.datetime.now() >= until:
+                break
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for keeper in keepers:
+        keeper.stop()
+    for keeper in keepers:
+        print(f"[保活] {keeper.cookie_file}：{'有效' if keeper.valid else '已失效'}，共检查 {keeper.checks} 次")
+
+
+if __name__ == "__main__":
+    main()
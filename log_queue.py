@@ -0,0 +1,160 @@
+"""
+不阻塞提交线程的日志
+
+原来的 setup_logging 直接挂 FileHandler 和 StreamHandler，重试循环每次 print 进度，
+写文件、写终端都发生在提交请求的线程里，开放时刻那一阵提交会被磁盘和终端拖慢。这里：
+- 日志记录只放进队列（QueueHandler），由后台线程（QueueListener）格式化成一行一个json写入 reservation.log，
+  同时按原来的格式输出到终端
+- 重试进度交给 ProgressLine：提交线程只更新一段文字，后台线程每 progress_interval 秒最多刷新一次终端，
+  多个任务并发时合并在同一行显示
+
+日志记录可以带结构化字段：
+    log.info("提交", extra={"fields": {"attempt": 3, "status": "retry"}, "console": False})
+fields 合并进json，console=False 的记录只写文件不输出到终端。
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+DEFAULT_LOG_FILE = 'reservation.log'
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化成一行json"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            data.update(fields)
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _ConsoleFilter(logging.Filter):
+    """去掉 console=False 的记录"""
+
+    def filter(self, record):
+        return getattr(record, 'console', True)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    只把记录放进队列，消息的 % 格式化留给后台线程
+    标准的 QueueHandler.prepare 会在调用线程里先格式化一遍，这里只在有异常时提前处理 traceback
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class ProgressLine(threading.Thread):
+    """
+    节流的进度行：update 只保存文字，后台线程定期用 \\r 刷新终端
+    :param interval: 两次刷新的最小间隔（秒）
+    """
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.lines = {}
+        self._shown = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def update(self, key, text):
+        """更新任务 key 的进度，由提交线程调用，不做任何I/O"""
+        self.lines[key] = text
+        if not self.is_alive() and not self._stop_event.is_set():
+            with self._lock:
+                if not self.is_alive():
+                    self.start()
+
+    def finish(self, key):
+        """任务结束：立即输出它最后的进度并换行，之后的 print 不会和进度行混在一起"""
+        text = self.lines.pop(key, None)
+        with self._lock:
+            if text is not None and text != self._shown:
+                print(f"\r{text}", end="")
+            if self._shown is not None or text is not None:
+                print()
+            self._shown = None
+
+    def _render(self):
+        with self._lock:
+            text = " | ".join(tuple(self.lines.values()))
+            if text and text != self._shown:
+                print(f"\r{text}", end="", flush=True)
+                self._shown = text
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._render()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+progress = ProgressLine()
+_listener = None
+
+
+def setup_logging(log_file=DEFAULT_LOG_FILE, level=logging.INFO, console=True, progress_interval=0.2):
+    """
+    把根日志接到队列上，启动后台写日志的线程，程序退出时自动写完剩余的记录
+    重复调用时直接返回
+    :param log_file: json日志文件
+    :param console: 是否同时输出到终端
+    :param progress_interval: 进度行的刷新间隔（秒）
+    :return: QueueListener
+    """
+    global _listener
+    if _listener:
+        return _listener
+    progress.interval = progress_interval
+
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        stream_handler.addFilter(_ConsoleFilter())
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def log_launch(log, status, sent_at, **fields):
+    """
+    每次提交写一条json日志（只写文件），在后台线程写入，不会拖慢提交
+    :param status: rate_control.response_kind 的结果或异常类型
+    :param sent_at: 发出请求时的本地时间戳
+    :param fields: 其他字段，例如 attempt、candidate、job
+    """
+    log.info("提交", extra={"console": False, "fields": dict(
+        fields, event="launch", status=status, latency_ms=round((time.time() - sent_at) * 1000, 1))})
@@ -0,0 +1,96 @@
+"""
+resource-info-margin 场地布局缓存
+
+main 的每次外层重试都会重新请求 margin 接口并重新整理时间段和台号。
+场地布局（base_time_id、base_sub_id、时间段和台号列表）在同一天内基本不变，
+这里按 resource_id 和日期把解析好的布局缓存在内存和磁盘上，过期（TTL）后再重新拉取。
+"""
+import json
+import os
+import time
+
+from eportal import fetch_margin_layout
+
+DEFAULT_CACHE_FILE = 'margin_cache.json'
+DEFAULT_TTL = 600
+
+# 内存缓存：{cache_file: {key: {"fetched_at": 时间戳, "layout": 布局}}}
+_memory = {}
+
+
+def _cache_key(resource_id, date):
+    return f"{resource_id}|{date}"
+
+
+def _load_disk(cache_file):
+    if cache_file not in _memory:
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                _memory[cache_file] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _memory[cache_file] = {}
+    return _memory[cache_file]
+
+
+def _save_disk(cache_file, entries):
+    """
+    先写临时文件再替换，避免中途退出留下损坏的缓存文件
+    临时文件名带进程号，worker_pool 的多个进程同时写缓存时不会互相覆盖临时文件
+    """
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"[缓存] 写入缓存文件失败：{e}")
+
+
+def get_cached_layout(resource_id, date, ttl=DEFAULT_TTL, cache_file=DEFAULT_CACHE_FILE):
+    """只查缓存，不发请求；没有或已过期时返回None"""
+    entry = _load_disk(cache_file).get(_cache_key(resource_id, date))
+    # 旧版本缓存里没有 slots 索引数据，视为未命中
+    if entry and 'slots' in entry['layout'] and time.time() - entry['fetched_at'] < ttl:
+        return entry['layout']
+    return None
+
+
+def put_layout(resource_id, date, layout, cache_file=DEFAULT_CACHE_FILE, ttl=DEFAULT_TTL):
+    """写入缓存，同时清理已经过期的条目"""
+    entries = _load_disk(cache_file)
+    now = time.time()
+    for key in [k for k, v in entries.items() if now - v['fetched_at'] >= ttl]:
+        del entries[key]
+    entries[_cache_key(resource_id, date)] = {"fetched_at": now, "layout": layout}
+    _save_disk(cache_file, entries)
+
+
+def get_layout(session, resource_id, date, ttl=DEFAULT_TTL, cache_file=DEFAULT_CACHE_FILE, refresh=False):
+    """
+    获取场地布局，优先使用缓存
+    :param session: 会话对象，缓存未命中时用于拉取
+    :param resource_id: 资源ID
+    :param date: 预约日期
+    :param ttl: 缓存有效期（秒），0 表示不使用缓存
+    :param cache_file: 磁盘缓存文件
+    :param refresh: 为True时忽略缓存强制重新拉取
+    :return: 场地布局dict，见 eportal.parse_margin_layout
+    """
+    if not refresh and ttl > 0:
+        layout = get_cached_layout(resource_id, date, ttl, cache_file)
+        if layout is not None:
+            return layout
+    layout = fetch_margin_layout(session, resource_id, date)
+    if ttl > 0:
+        put_layout(resource_id, date, layout, cache_file, ttl)
+    return layout
+
+
+def invalidate(resource_id=None, date=None, cache_file=DEFAULT_CACHE_FILE):
+    """删除缓存；不传参数时清空全部"""
+    entries = _load_disk(cache_file)
+    if resource_id is None:
+        entries.clear()
+    else:
+        entries.pop(_cache_key(resource_id, date), None)
+    _save_disk(cache_file, entries)
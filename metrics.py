@@ -0,0 +1,222 @@
+"""
+请求耗时统计
+
+给 session 挂上 InstrumentedAdapter 后，经过它的每个HTTP请求都会记录：
+DNS解析、TCP连接、TLS握手（只有新建连接时才有）、首字节时间（TTFB）、总耗时、
+HTTP状态码和服务器返回的错误信息（json里的 m 字段）。
+运行结束后输出 p50/p95/p99 和错误分布，并以 JSON Lines 追加写入文件，方便对比不同的运行和网络。
+"""
+import datetime
+import json
+import math
+import socket
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 当前线程正在进行的请求的各阶段耗时（秒）
+_local = threading.local()
+
+
+def _phases():
+    phases = getattr(_local, 'phases', None)
+    if phases is None:
+        phases = _local.phases = {}
+    return phases
+
+
+def start_phases():
+    """
+    开始记录当前线程的一个请求：之后新建连接时的 DNS/连接/TLS 耗时写进返回的dict
+    只有使用 TimedHTTP(S)ConnectionPool 的连接池（InstrumentedAdapter 建立的）才会记录
+    """
+    phases = _local.phases = {}
+    return phases
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        phases = _phases()
+        dns_host = self._dns_host
+        t0 = time.perf_counter()
+        try:
+            address = socket.getaddrinfo(dns_host, self.port, 0, socket.SOCK_STREAM)[0][4][0]
+        except socket.gaierror:
+            # 交给 urllib3 自己解析并抛出它的异常类型
+            address = None
+        t1 = time.perf_counter()
+        if address:
+            self._dns_host = address
+        try:
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+        phases['dns'] = t1 - t0
+        phases['connect'] = time.perf_counter() - t1
+        return sock
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        phases = _phases()
+        phases['tls'] = time.perf_counter() - t0 - phases.get('dns', 0) - phases.get('connect', 0)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """记录每个请求各阶段耗时的 HTTPAdapter"""
+
+    def __init__(self, recorder, **kwargs):
+        self.recorder = recorder
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        phases = start_phases()
+        t0 = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            self.recorder.record(request, phases, total=time.perf_counter() - t0, error=type(e).__name__)
+            raise
+        ttfb = time.perf_counter() - t0
+        if not kwargs.get('stream'):
+            # 读完响应体，总耗时才包含传输时间
+            content = response.content
+        else:
+            content = None
+        self.recorder.record(request, phases, ttfb=ttfb, total=time.perf_counter() - t0,
+                             status=response.status_code, message=_server_message(response, content))
+        return response
+
+
+def _server_message(response, content):
+    """launch/margin 等接口返回json，取出其中的错误信息"""
+    if not content or 'json' not in response.headers.get('Content-Type', ''):
+        return None
+    try:
+        result = json.loads(content)
+    except ValueError:
+        return None
+    if isinstance(result, dict) and result.get('e') not in (0, None):
+        return result.get('m')
+    return None
+
+
+def percentile(values, p):
+    """最近秩法求百分位数"""
+    if not values:
+        return None
+    values = sorted(values)
+    k = max(0, math.ceil(p / 100 * len(values)) - 1)
+    return values[k]
+
+
+class LatencyRecorder:
+    """收集请求耗时记录，线程安全"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, request, phases, ttfb=None, total=None, status=None, error=None, message=None):
+        def ms(value):
+            return None if value is None else round(value * 1000, 2)
+
+        entry = {
+            "ts": time.time(),
+            "method": request.method,
+            "endpoint": urlsplit(request.url).path,
+            "status": status,
+            "dns": ms(phases.get('dns')),
+            "connect": ms(phases.get('connect')),
+            "tls": ms(phases.get('tls')),
+            "ttfb": ms(ttfb),
+            "total": ms(total),
+            "error": error,
+            "message": message,
+        }
+        with self._lock:
+            self.records.append(entry)
+
+    def summary(self):
+        """整体和各接口的 p50/p95/p99（毫秒），以及错误分布"""
+        with self._lock:
+            records = list(self.records)
+
+        def latency(rs):
+            totals = [r['total'] for r in rs if r['total'] is not None and not r['error']]
+            ttfbs = [r['ttfb'] for r in rs if r['ttfb'] is not None]
+            return {
+                "count": len(rs),
+                "total_p50": percentile(totals, 50),
+                "total_p95": percentile(totals, 95),
+                "total_p99": percentile(totals, 99),
+                "ttfb_p50": percentile(ttfbs, 50),
+                "ttfb_p95": percentile(ttfbs, 95),
+                "ttfb_p99": percentile(ttfbs, 99),
+                "new_connections": sum(1 for r in rs if r['connect'] is not None),
+            }
+
+        endpoints = {}
+        for r in records:
+            endpoints.setdefault(r['endpoint'], []).append(r)
+        errors = Counter(r['error'] or r['message'] for r in records if r['error'] or r['message'])
+        return {
+            "overall": latency(records),
+            "endpoints": {name: latency(rs) for name, rs in endpoints.items()},
+            "errors": dict(errors.most_common()),
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        print("\n===== 请求耗时统计（毫秒） =====")
+        for name, s in [("全部", summary['overall'])] + sorted(summary['endpoints'].items()):
+            print(f"{name}: {s['count']} 次，总耗时 p50={s['total_p50']} p95={s['total_p95']} p99={s['total_p99']}，"
+                  f"TTFB p50={s['ttfb_p50']}，新建连接 {s['new_connections']} 次")
+        if summary['errors']:
+            print("错误分布：" + "，".join(f"{k} × {v}" for k, v in summary['errors'].items()))
+        return summary
+
+    def write_jsonl(self, path, run_info=None):
+        """把本次运行的全部请求记录和汇总追加写入 JSON Lines 文件"""
+        run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        with self._lock:
+            records = list(self.records)
+        with open(path, 'a', encoding='utf-8') as f:
+            for r in records:
+                f.write(json.dumps(dict(r, type="request", run=run_id), ensure_ascii=False) + "\n")
+            f.write(json.dumps({"type": "summary", "run": run_id, "info": run_info or {}, **self.summary()},
+                               ensure_ascii=False) + "\n")
+
+
+def instrument_session(session, recorder, pool_size=10):
+    """给session挂上耗时统计，返回 recorder"""
+    adapter = InstrumentedAdapter(recorder, pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return recorder
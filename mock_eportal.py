@@ -0,0 +1,245 @@
+"""
+本地模拟的 eportal 服务器
+
+模拟 /v2/site/index、/v2/reserve/hallView、/v2/reserve/reserveDetail、
+/site/reservation/resource-info-margin 和 /site/reservation/launch 接口，支持：
+- 固定延迟加随机抖动（latency / jitter）
+- 开放时间（release_at）：之前提交一律返回「预约日期未达到」
+- 限流：同一cookie在 throttle_window 秒内超过 throttle 次请求返回「点击太频繁了」
+- 场地争抢：开放后 competitor_delay 秒起，competitors 个虚拟对手陆续抢走随机场地
+- 卡顿：每个请求有 stall_rate 的概率额外延迟 stall 秒，模拟某条连接卡住
+
+单独运行：
+    python mock_eportal.py --port 8000 --release-in 30 --latency 0.02 --throttle 10 --competitors 5
+然后设置环境变量 EPORTAL_BASE_URL=http://127.0.0.1:8000 再运行 try.py。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 场馆布局：resource_id -> (场馆名, 台数, 时间段列表, 第一个period, 第一个sub_id)
+DEFAULT_VENUES = {
+    "57": ("南校区羽毛球馆", 8, ["08:00-09:00", "09:00-10:00", "10:00-11:00", "11:00-12:00", "12:00-13:00",
+                           "13:00-14:10", "14:10-15:10", "15:10-16:10", "16:10-17:10", "17:10-18:10",
+                           "18:10-19:10", "19:10-20:10", "20:10-21:10", "21:10-22:10"], 4439, 20842),
+    "85": ("南校区综合馆", 6, ["08:00-09:00", "09:00-10:00", "10:00-11:00", "11:00-12:00", "12:00-13:00",
+                         "13:00-14:10", "14:10-15:10", "15:10-16:10", "16:10-17:10", "17:10-18:10",
+                         "18:10-19:10", "19:10-20:10", "20:10-21:10", "21:10-22:10"], 4480, 21052),
+}
+
+
+class MockEportal:
+    """
+    模拟服务器的状态，线程安全
+    :param release_at: 开放时间（本地时间戳），None 表示一直开放
+    :param latency: 每个请求的固定延迟（秒）
+    :param jitter: 延迟的随机抖动上限（秒）
+    :param throttle: 每个cookie在 throttle_window 秒内允许的最大提交次数，0 表示不限流
+    :param competitors: 开放后抢走场地的虚拟对手数量
+    :param competitor_delay: 开放后多少秒对手开始抢
+    :param stall_rate: 请求卡顿的概率（0~1）
+    :param stall: 卡顿时额外的延迟（秒）
+    """
+
+    def __init__(self, release_at=None, latency=0.0, jitter=0.0, throttle=0, throttle_window=1.0,
+                 competitors=0, competitor_delay=0.05, venues=None, seed=None, stall_rate=0.0, stall=0.0):
+        self.release_at = release_at
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.throttle_window = throttle_window
+        self.competitors = competitors
+        self.competitor_delay = competitor_delay
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.venues = venues or DEFAULT_VENUES
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.booked = {}
+        self.history = {}
+        self.stats = {"launch": 0, "accepted": 0, "success": 0, "throttled": 0, "not_open": 0, "taken": 0,
+                      "first_accepted_at": None, "first_success_at": None}
+        self._competitors_done = False
+        self.server = None
+
+    def slots(self, resource_id):
+        """{(period, sub_id): (yaxis, abscissa)}"""
+        name, tables, times, base_period, base_sub = self.venues[resource_id]
+        return {(base_period + t, base_sub + 14 * s - t): (times[t], f"{s + 1}号台")
+                for s in range(tables) for t in range(len(times))}
+
+    def is_open(self, now=None):
+        return self.release_at is None or (now or time.time()) >= self.release_at
+
+    def _run_competitors(self, now):
+        if self._competitors_done or not self.competitors:
+            return
+        if self.release_at is not None and now < self.release_at + self.competitor_delay:
+            return
+        self._competitors_done = True
+        for resource_id in self.venues:
+            free = [key for key in self.slots(resource_id) if (resource_id,) + key not in self.booked]
+            for key in self.random.sample(free, min(self.competitors, len(free))):
+                self.booked[(resource_id,) + key] = "competitor"
+
+    def margin(self, resource_id, date):
+        name, tables, times, base_period, base_sub = self.venues[resource_id]
+        with self.lock:
+            self._run_competitors(time.time())
+            d = {}
+            for (period, sub_id), (yaxis, abscissa) in self.slots(resource_id).items():
+                d.setdefault(abscissa, []).append({
+                    "yaxis": yaxis, "abscissa": abscissa, "time_id": period, "sub_id": sub_id,
+                    "margin": 0 if (resource_id, period, sub_id) in self.booked else 1,
+                })
+        return {"e": 0, "m": "操作成功", "d": d}
+
+    def launch(self, client, form):
+        now = time.time()
+        with self.lock:
+            self.stats['launch'] += 1
+            if self.throttle:
+                history = self.history.setdefault(client, deque())
+                while history and now - history[0] > self.throttle_window:
+                    history.popleft()
+                history.append(now)
+                if len(history) > self.throttle:
+                    self.stats['throttled'] += 1
+                    return {"e": 1, "m": "点击太频繁了", "d": {}}
+            if not self.is_open(now):
+                self.stats['not_open'] += 1
+                return {"e": 1, "m": "预约日期未达到", "d": {}}
+            self.stats['accepted'] += 1
+            if self.stats['first_accepted_at'] is None:
+                self.stats['first_accepted_at'] = now
+            self._run_competitors(now)
+            resource_id = form.get('resource_id', [''])[0]
+            try:
+                reservations = json.loads(form.get('data', ['[]'])[0])
+                slots = self.slots(resource_id)
+                keys = [(resource_id, int(r['period']), int(r['sub_resource_id'])) for r in reservations]
+            except (KeyError, ValueError, TypeError):
+                return {"e": 1, "m": "参数错误", "d": {}}
+            if not keys or any(key[1:] not in slots for key in keys):
+                return {"e": 1, "m": "参数错误", "d": {}}
+            if any(key in self.booked for key in keys):
+                self.stats['taken'] += 1
+                return {"e": 1, "m": "该时间段已被预约", "d": {}}
+            for key in keys:
+                self.booked[key] = client
+            self.stats['success'] += 1
+            if self.stats['first_success_at'] is None:
+                self.stats['first_success_at'] = now
+            return {"e": 0, "m": "操作成功", "d": {"appointment_id": self.stats['success']}}
+
+    def start(self, host='127.0.0.1', port=0):
+        """在后台线程启动服务器，返回其地址（例如 http://127.0.0.1:8000）"""
+        handler = type('Handler', (_Handler,), {'mock': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体一次写出，避免 Nagle 算法带来的额外延迟
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _client(self):
+        cookie = self.headers.get('Cookie', '')
+        for item in cookie.split(';'):
+            if item.strip().startswith('PHPSESSID='):
+                return item.strip()[len('PHPSESSID='):]
+        return None
+
+    def _delay(self):
+        delay = self.mock.latency + self.mock.random.random() * self.mock.jitter
+        if self.mock.stall_rate and self.mock.random.random() < self.mock.stall_rate:
+            delay += self.mock.stall
+        if delay > 0:
+            time.sleep(delay)
+
+    def _send(self, body, content_type='application/json', status=200):
+        if isinstance(body, dict):
+            body = json.dumps(body, ensure_ascii=False)
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        self._delay()
+        self._send('', 'text/html')
+
+    def do_GET(self):
+        self._delay()
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/v2/site/index':
+            self._send('<html>个人主页</html>' if self._client() else '<html>统一身份认证 登录</html>', 'text/html')
+        elif url.path in ('/v2/reserve/hallView', '/v2/reserve/reserveDetail', '/'):
+            self._send('<html></html>', 'text/html')
+        elif url.path == '/site/reservation/resource-info-margin':
+            resource_id = query.get('resource_id', [''])[0]
+            if resource_id not in self.mock.venues:
+                self._send({"e": 1, "m": "参数错误", "d": {}})
+            else:
+                self._send(self.mock.margin(resource_id, query.get('start_time', [''])[0]))
+        else:
+            self._send('not found', 'text/plain', 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        self._delay()
+        if urlsplit(self.path).path == '/site/reservation/launch':
+            self._send(self.mock.launch(self._client(), form))
+        else:
+            self._send('not found', 'text/plain', 404)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟 eportal 服务器')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--release-in', type=float, default=None, help='多少秒后开放预约，不填表示一直开放')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机抖动（秒）')
+    parser.add_argument('--throttle', type=int, default=0, help='每个cookie每秒允许的提交次数，0表示不限流')
+    parser.add_argument('--competitors', type=int, default=0, help='开放后抢走场地的虚拟对手数量')
+    args = parser.parse_args()
+
+    release_at = time.time() + args.release_in if args.release_in is not None else None
+    mock = MockEportal(release_at, args.latency, args.jitter, args.throttle, competitors=args.competitors)
+    url = mock.start(port=args.port)
+    print(f"模拟服务器已启动：{url}")
+    if release_at:
+        print(f"开放时间：{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(release_at))}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n统计：{mock.stats}")
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
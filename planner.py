@@ -0,0 +1,306 @@
+"""
+按周重复的预约计划
+
+main 只能处理一个 date，并且最多连续两个时间段。这里读取按周重复的规则，例如
+「每周二、周四 19:00-21:00，resource 57，任意台号」，展开成按开放时间排序的预约任务，在一个进程里依次执行：
+1. 开放前 prepare_lead 秒：检查cookie、从场地布局缓存解析出每个任务的候选场地（时间段数不限）
+2. 预热连接、校准服务器时钟
+3. 在开放时刻同时提交同一批开放的所有任务，结果追加写入 plan_results.jsonl
+
+规则只在需要时才展开：队列里每条规则最多只有一个待执行的日期，执行完再放入它的下一次，
+所以计划多长（甚至不限天数）都只占用和规则数量成正比的内存。
+
+用法：
+    python planner.py --plan plan.json              # 按计划运行
+    python planner.py --plan plan.json --dry-run    # 只列出接下来的任务
+计划文件格式见 plan.example.json。
+"""
+import argparse
+import datetime
+import heapq
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from eportal import check_session, get_session_with_cookie, wait_until
+from margin_cache import get_layout
+from connection_pool import warm_up_session, open_connections
+from clock_sync import make_scheduler
+from slot_selector import select_candidates
+from prepared import PreparedReservation
+from rate_control import pacer_from_config
+from hedge import hedge_options
+from release_profile import ReleaseProfiler, DEFAULT_HISTORY_FILE
+from keepalive import SessionKeeper
+from log_queue import setup_logging
+
+# 规则里可以覆盖的参数及默认值
+RULE_DEFAULTS = {
+    "cookie_file": "cookie.txt",
+    "slots": 1,
+    "days_ahead": 1,
+    "release_time": "00:00:00",
+    "max_attempts": 1000,
+    "retry_delay": 0.2,
+    "request_timeout": 3,
+}
+
+WEEKDAY_NAMES = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+    "一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6,
+}
+
+
+def parse_weekdays(weekdays):
+    """
+    把 ["Tue", "Thu"]、["周二", "星期四"] 或 [2, 4]（周一为1）解析成 {1, 3}（周一为0，同 date.weekday()）
+    """
+    result = set()
+    for day in weekdays:
+        if isinstance(day, int):
+            if not 1 <= day <= 7:
+                raise ValueError(f"星期应为1~7：{day}")
+            result.add(day - 1)
+            continue
+        key = re.sub(r'^(周|星期)', '', str(day).strip()).lower()[:3]
+        if key not in WEEKDAY_NAMES:
+            raise ValueError(f"无法识别的星期：{day}")
+        result.add(WEEKDAY_NAMES[key])
+    if not result:
+        raise ValueError("weekdays 不能为空")
+    return result
+
+
+def release_datetime(rule, date):
+    """预约日期 date 的开放时间：提前 days_ahead 天的 release_time"""
+    release_time = datetime.datetime.strptime(rule['release_time'], "%H:%M:%S").time()
+    return datetime.datetime.combine(date - datetime.timedelta(days=rule['days_ahead']), release_time)
+
+
+def rule_occurrences(rule, start_date):
+    """按日期顺序无限地生成规则匹配的预约日期"""
+    weekdays = rule['_weekdays']
+    date = start_date
+    while True:
+        if date.weekday() in weekdays:
+            yield date
+        date += datetime.timedelta(days=1)
+
+
+class PlanQueue:
+    """
+    按开放时间排序的任务队列（小顶堆）
+    每条规则只保留下一个日期，弹出后再补上该规则的下一次
+    """
+
+    def __init__(self, rules, now=None, late_window=60, until=None):
+        """
+        :param now: 当前时间，开放时间早于 now - late_window 的日期直接跳过
+        :param until: 可选，只生成预约日期不晚于 until 的任务
+        """
+        self.rules = rules
+        self.until = until
+        self.heap = []
+        now = now or datetime.datetime.now()
+        self.cutoff = now - datetime.timedelta(seconds=late_window)
+        self.iterators = [rule_occurrences(rule, now.date()) for rule in rules]
+        for i in range(len(rules)):
+            self._push_next(i)
+
+    def _push_next(self, i):
+        for date in self.iterators[i]:
+            if self.until and date > self.until:
+                return
+            release = release_datetime(self.rules[i], date)
+            if release >= self.cutoff:
+                heapq.heappush(self.heap, (release, i, date))
+                return
+
+    def pop_batch(self):
+        """
+        弹出开放时间最早的一批任务（开放时间相同的合并为一批）
+        :return: (开放时间, [(规则, 日期), ...])，队列为空时返回 (None, [])
+        """
+        if not self.heap:
+            return None, []
+        release, i, date = heapq.heappop(self.heap)
+        batch = [(self.rules[i], date)]
+        self._push_next(i)
+        while self.heap and self.heap[0][0] == release:
+            _, j, other = heapq.heappop(self.heap)
+            batch.append((self.rules[j], other))
+            self._push_next(j)
+        return release, batch
+
+    def __len__(self):
+        return len(self.heap)
+
+
+def load_plan(plan_file):
+    """读取计划文件，把 defaults 合并进每条规则并检查格式"""
+    with open(plan_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    defaults = dict(RULE_DEFAULTS, **data.get('defaults', {}))
+    rules = []
+    for i, rule in enumerate(data.get('rules', [])):
+        merged = dict(defaults, **rule)
+        merged.setdefault('name', f"规则{i + 1}")
+        if not merged.get('resource_id') or not merged.get('selector'):
+            raise ValueError(f"{merged['name']}：resource_id 和 selector 为必填项")
+        if int(merged['slots']) < 1:
+            raise ValueError(f"{merged['name']}：slots 至少为1")
+        merged['_weekdays'] = parse_weekdays(merged.get('weekdays', []))
+        rules.append(merged)
+    return rules, defaults
+
+
+def prepare_job(rule, date, session, margin_cache_ttl=600):
+    """开放前为一个任务解析候选场地，返回 PreparedReservation"""
+    date_str = date.isoformat()
+    layout = get_layout(session, rule['resource_id'], date_str, margin_cache_ttl)
+    candidates = select_candidates(layout, date_str, rule['selector'], int(rule['slots']))
+    return PreparedReservation(session, rule['resource_id'], date_str, candidates, rule['cookie_file'])
+
+
+def run_batch(release, batch, sessions, defaults):
+    """
+    等到 release 开放时间，同时执行这一批任务
+    :return: 结果列表 [{name, date, resource_id, status}]
+    """
+    prepare_lead = defaults.get('prepare_lead', 120)
+    warmup_lead = defaults.get('warmup_lead', 3)
+    history_file = defaults.get('release_history_file', DEFAULT_HISTORY_FILE)
+    names = ', '.join(f"{rule['name']} {date}" for rule, date in batch)
+    print(f"\n=== {release} 开放：{names} ===")
+    wait_until(release - datetime.timedelta(seconds=prepare_lead))
+    print()
+
+    results = []
+    prepared = []
+    for rule, date in batch:
+        result = {"name": rule['name'], "date": date.isoformat(), "resource_id": rule['resource_id']}
+        results.append(result)
+        cookie_file = rule['cookie_file']
+        session = sessions.get(cookie_file)
+        try:
+            if not session or not check_session(session):
+                # 缓存里没有或已失效：cookie 文件可能在两次开放之间更新过，重新读取
+                session = get_session_with_cookie(cookie_file)
+                if not session or not check_session(session):
+                    sessions.pop(cookie_file, None)
+                    result['status'] = "cookie无效"
+                    continue
+                sessions[cookie_file] = session
+            prepared.append((result, rule, prepare_job(rule, date, session, defaults.get('margin_cache_ttl', 600))))
+        except Exception as e:
+            print(f"[{rule['name']}] 准备失败：{e}")
+            result['status'] = "准备失败"
+    if not prepared:
+        return results
+
+    # 同一个cookie文件的任务共用一个会话，每个会话只预热、保活一次
+    used = {p.cookie_file: p.session for _, _, p in prepared}
+    pool_size = max(defaults.get('warmup_connections', 4), len(prepared))
+    for session in used.values():
+        warm_up_session(session, pool_size)
+    for _, _, p in prepared:
+        p.open_pages()
+    first = next(iter(used.values()))
+    if defaults.get('clock_sync', True):
+        wait = make_scheduler(first, defaults.get('clock_sync_samples', 12), refine_rounds=defaults.get('clock_sync_refine', 6))
+        clock = wait.stats
+    else:
+        wait, clock = wait_until, None
+    profilers = {}
+    if history_file:
+        for _, _, p in prepared:
+            if p.resource_id not in profilers:
+                profilers[p.resource_id] = ReleaseProfiler(p.resource_id, release, clock)
+
+    # 等待期间保活，开始前 warmup_lead 秒刷新连接
+    keepers = [SessionKeeper(session, cookie_file, defaults.get('keepalive_interval', 300), until=release)
+               for cookie_file, session in used.items()]
+    for keeper in keepers:
+        keeper.start()
+    try:
+        refresh_time = release - datetime.timedelta(seconds=warmup_lead)
+        if datetime.datetime.now() < refresh_time:
+            wait(refresh_time)
+            print()
+            for session in used.values():
+                open_connections(session, pool_size)
+        wait(release)
+    finally:
+        for keeper in keepers:
+            keeper.stop()
+    print()
+
+    def run(item):
+        result, rule, p = item
+        profiler = profilers.get(p.resource_id)
+        return p.run(rule['max_attempts'], rule['retry_delay'], rule['request_timeout'], pacer=pacer_from_config(rule),
+                     fast_send=rule.get('fast_send', False), hedge=hedge_options(rule),
+                     on_response=profiler.observe if profiler else None)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(prepared)) as executor:
+            outcomes = list(executor.map(run, prepared))
+    finally:
+        for profiler in profilers.values():
+            profiler.save(history_file)
+    for (result, _, _), ok in zip(prepared, outcomes):
+        result['status'] = "成功" if ok else "失败"
+    return results
+
+
+def run_plan(plan_file, days=14, dry_run=False, limit=20, results_file='plan_results.jsonl'):
+    """
+    按计划运行
+    :param days: 只安排今天起 days 天内的预约日期，0 表示不限（一直运行）
+    :param dry_run: 只打印接下来的 limit 个任务
+    """
+    rules, defaults = load_plan(plan_file)
+    until = datetime.date.today() + datetime.timedelta(days=days) if days else None
+    queue = PlanQueue(rules, late_window=defaults.get('late_window', 60), until=until)
+    print(f"共 {len(rules)} 条规则")
+
+    if dry_run:
+        for _ in range(limit):
+            release, batch = queue.pop_batch()
+            if not release:
+                break
+            for rule, date in batch:
+                print(f"{release}\t{rule['name']}\tresource {rule['resource_id']}\t{date}（周{'一二三四五六日'[date.weekday()]}）")
+        return
+
+    sessions = {}
+    ok = total = 0
+    while True:
+        release, batch = queue.pop_batch()
+        if not release:
+            break
+        for result in run_batch(release, batch, sessions, defaults):
+            total += 1
+            ok += result.get('status') == "成功"
+            print(f"{result['name']}\t{result['date']}\t{result.get('status')}")
+            with open(results_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(result, release=release.isoformat(sep=' ')), ensure_ascii=False) + "\n")
+    print(f"\n计划执行完毕：共 {total} 个任务，成功 {ok} 个")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按周重复的预约计划')
+    parser.add_argument('--plan', type=str, default='plan.json', help='计划文件')
+    parser.add_argument('--days', type=int, default=14, help='安排今天起多少天内的预约，0表示不限')
+    parser.add_argument('--dry-run', action='store_true', help='只列出接下来的任务，不预约')
+    parser.add_argument('--results', type=str, default='plan_results.jsonl', help='结果追加写入的文件')
+    args = parser.parse_args()
+    setup_logging()
+    try:
+        run_plan(args.plan, args.days, args.dry_run, results_file=args.results)
+    except KeyboardInterrupt:
+        print("\n用户中断程序")
+
+
+if __name__ == "__main__":
+    main()
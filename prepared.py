@@ -0,0 +1,125 @@
+"""
+预先准备好的预约
+
+原来 main 的每次外层重试都要重新测试网络、读取 cookie.txt、访问个人主页检查cookie、
+拉取场地布局并等待用户输入，一次补救要花好几个往返外加人工输入。
+这里在开抢前把这些事情都做一次：会话、已检查的cookie、查好的ID和编码好的表单都保存在
+PreparedReservation 里，之后的外层重试直接复用，几毫秒内就能重新开始提交。
+"""
+from eportal import (
+    test_connection,
+    get_session_with_cookie,
+    check_session,
+    open_reservation_pages,
+    encode_launch_body,
+    make_reservation,
+    make_reservation_candidates,
+)
+from margin_cache import get_layout
+from hedge import build_launcher
+from metrics import instrument_session
+
+
+class CookieInvalidError(RuntimeError):
+    """cookie 缺失或已失效，重试也没有用，需要重新登录"""
+
+
+class PreparedReservation:
+    """
+    一次预约需要的全部状态
+    :param session: 已检查过cookie的会话对象
+    :param resource_id: 预约资源ID
+    :param date: 预约日期
+    :param candidates: 按优先级排好的候选列表，每个候选是一组 reservations
+    :param cookie_file: cookie文件，reconnect 时重新读取
+    :param recorder: 可选，metrics.LatencyRecorder
+    """
+
+    def __init__(self, session, resource_id, date, candidates, cookie_file='cookie.txt', recorder=None):
+        self.session = session
+        self.resource_id = resource_id
+        self.date = date
+        self.candidates = candidates
+        self.cookie_file = cookie_file
+        self.recorder = recorder
+        # 每个候选的表单只编码一次
+        self.payloads = [encode_launch_body(resource_id, reservations) for reservations in candidates]
+        self.pages_opened = False
+
+    @property
+    def reservations(self):
+        """首选的 reservations"""
+        return self.candidates[0]
+
+    def open_pages(self):
+        """访问大厅和详情页，只需要做一次"""
+        if not self.pages_opened:
+            open_reservation_pages(self.session, self.resource_id)
+            self.pages_opened = True
+
+    def reconnect(self):
+        """
+        重新读取cookie并建立会话，只在提交过程中出现异常后调用
+        :return: 是否成功
+        """
+        session = get_session_with_cookie(self.cookie_file)
+        if not session:
+            return False
+        if self.recorder:
+            instrument_session(session, self.recorder)
+        if not check_session(session):
+            return False
+        self.session = session
+        self.pages_opened = False
+        return True
+
+    def run(self, max_attempts=1000, retry_delay=0.1, request_timeout=10, pacer=None, is_available=None, fast_send=False,
+            hedge=None, on_response=None):
+        """
+        用准备好的会话和表单提交预约
+        :param is_available: 可选，判断候选是否还有余量的函数（例如 AvailabilityPoller.candidate_available）
+        :param fast_send: 是否用 fast_send.FastLauncher 提交预先编码好的请求
+        :param hedge: 可选，hedge.hedge_options 的结果，开启对冲提交
+        :param on_response: 可选，见 make_reservation
+        :return: 是否预约成功
+        """
+        open_pages = not self.pages_opened
+        # make_reservation 会自己访问大厅和详情页，之后的重试不再重复
+        self.pages_opened = True
+        # 每次 run 都重新生成，保证用的是预热后挂上的连接池和最新的cookie
+        launcher = build_launcher(self.session, self.resource_id, self.payloads, fast_send, hedge)
+        if len(self.candidates) > 1 or is_available:
+            return make_reservation_candidates(self.session, self.candidates, self.resource_id, max_attempts, retry_delay,
+                                               request_timeout, is_available=is_available, pacer=pacer,
+                                               payloads=self.payloads, open_pages=open_pages, launcher=launcher,
+                                               on_response=on_response)
+        return make_reservation(self.session, self.reservations, self.resource_id, max_attempts, retry_delay,
+                                request_timeout, pacer=pacer, payload=self.payloads[0], open_pages=open_pages,
+                                launcher=launcher, on_response=on_response)
+
+
+def prepare_reservation(resource_id, date, choose_candidates, margin_cache_ttl=600, cookie_file='cookie.txt', recorder=None):
+    """
+    开抢前做好一次预约需要的全部准备
+    :param choose_candidates: 选择场地的函数 choose_candidates(layout, date) -> 候选列表；
+                              交互模式下在这里等待输入，无人值守时用 slot_selector 按配置解析
+    :return: PreparedReservation；网络不通时返回 None，可以稍后重试
+    :raises CookieInvalidError: cookie 缺失或已失效
+    """
+    if not test_connection():
+        print("网络连接测试失败，请检查网络")
+        return None
+
+    print("加载cookie...")
+    session = get_session_with_cookie(cookie_file)
+    if not session:
+        raise CookieInvalidError("cookie无效")
+    if recorder:
+        instrument_session(session, recorder)
+    # 检查cookie是否有效（尝试访问个人主页）
+    if not check_session(session):
+        raise CookieInvalidError("cookie已失效，请重新扫码登录并复制cookie")
+
+    layout = get_layout(session, resource_id, date, margin_cache_ttl)
+    candidates = choose_candidates(layout, date)
+    return PreparedReservation(session, resource_id, date, candidates, cookie_file, recorder)
@@ -0,0 +1,105 @@
+"""
+根据服务器错误码自适应调整重试间隔
+
+固定的 retry_delay 对所有错误一视同仁。这里按错误类型调整：
+- 「预约日期未达到」：还没开放，间隔逐步收紧到 min_delay，开放后第一时间提交
+- 「点击太频繁了」「系统繁忙」、超时和连接错误：按指数退避并加随机抖动，避免被限流
+- 其他响应（包括已被预约、参数错误等）：说明服务器正常处理了请求，间隔逐步恢复到 base_delay
+每类响应都有计数，方便事后分析。
+"""
+import json
+import random
+from collections import Counter
+
+import requests
+
+# 服务器错误信息到错误类型的对应关系，未列出的错误信息归为 'error'
+ERROR_CLASSES = {
+    "预约日期未达到": "not_open",
+    "点击太频繁了": "throttled",
+    "系统繁忙": "busy",
+    "网络错误": "busy",
+}
+
+# 需要退避的错误类型
+BACKOFF_KINDS = ("throttled", "busy", "timeout", "connection_error")
+
+
+def response_kind(result):
+    """把 launch 接口的返回结果归类：success、not_open、throttled、busy 或 error"""
+    if result.get('e') == 0:
+        return 'success'
+    return ERROR_CLASSES.get(result.get('m', '未知错误'), 'error')
+
+
+def exception_kind(error):
+    """把提交时的异常归类：timeout、connection_error、bad_response 或 exception，与同步的重试循环一致"""
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'connection_error'
+    if isinstance(error, json.JSONDecodeError):
+        return 'bad_response'
+    return 'exception'
+
+
+class AdaptivePacer:
+    """
+    自适应重试间隔
+    :param base_delay: 正常情况下的重试间隔（秒）
+    :param min_delay: 未开放时收紧到的最小间隔（秒）
+    :param max_delay: 退避的最大间隔（秒）
+    :param backoff: 每次被限流时间隔乘以的倍数
+    :param recover: 每次正常响应后，当前间隔向目标间隔靠拢的比例（0~1）
+    :param jitter: 退避时加入的随机抖动比例（0~1）
+    """
+
+    def __init__(self, base_delay=0.1, min_delay=None, max_delay=2.0, backoff=2.0, recover=0.5, jitter=0.5):
+        self.base_delay = base_delay
+        self.min_delay = base_delay if min_delay is None else min_delay
+        self.max_delay = max(max_delay, base_delay)
+        self.backoff = backoff
+        self.recover = recover
+        self.jitter = jitter
+        self.delay = base_delay
+        self.counters = Counter()
+
+    def record(self, kind):
+        """只计数，不计算间隔（例如成功或换候选时）"""
+        self.counters[kind] += 1
+
+    def next_delay(self, kind):
+        """
+        记录一次响应并返回下一次请求前应等待的秒数
+        :param kind: response_kind 的结果，或 'timeout'、'connection_error' 等本地错误
+        """
+        self.record(kind)
+        if kind in BACKOFF_KINDS:
+            self.delay = min(self.max_delay, max(self.delay, self.base_delay) * self.backoff)
+            # 抖动只往下取，避免多个任务同时醒来再次触发限流
+            return self.delay * (1 - self.jitter * random.random())
+        target = self.min_delay if kind == 'not_open' else self.base_delay
+        self.delay = target + (self.delay - target) * (1 - self.recover)
+        return self.delay
+
+    def stats(self):
+        """当前间隔和各类响应的计数"""
+        return {"delay": round(self.delay, 4), "counters": dict(self.counters)}
+
+
+def fixed_pacer(retry_delay):
+    """间隔固定为 retry_delay 的 pacer，行为与原来的 time.sleep(retry_delay) 相同，但同样有计数"""
+    return AdaptivePacer(retry_delay, min_delay=retry_delay, max_delay=retry_delay, backoff=1.0, jitter=0.0)
+
+
+def pacer_from_config(config):
+    """
+    按配置创建 pacer
+    adaptive_pacing（默认true）、retry_delay、min_retry_delay（默认等于retry_delay）、max_retry_delay（默认2秒）
+    """
+    retry_delay = config.get('retry_delay', 0.1)
+    if not config.get('adaptive_pacing', True):
+        return fixed_pacer(retry_delay)
+    return AdaptivePacer(retry_delay,
+                         min_delay=config.get('min_retry_delay', retry_delay),
+                         max_delay=config.get('max_retry_delay', 2.0))
@@ -0,0 +1,212 @@
+"""
+开放时刻记录
+
+我们其实不知道服务器从「预约日期未达到」切换到受理请求的准确时刻，也不知道它每天漂移多少。
+ReleaseProfiler 挂在 make_reservation 的响应处理上，用校准过的服务器时间记录每个 resource_id：
+- 最后一次「预约日期未达到」和第一次被受理（成功、已被预约或其他业务错误）的时间，由此夹出开放时刻
+- 第一次「已被预约」的时间，即别人最快在开放后多久抢走场地
+每次运行追加写入 release_history.jsonl，suggest_lead 按历史给出下次 --lead 的建议值，
+不再靠猜，也不会在开放前浪费太多次提交。
+
+查看历史和建议：
+    python release_profile.py --resource_id 57
+"""
+import argparse
+import datetime
+import json
+import statistics
+import threading
+
+from eportal import classify_response
+from rate_control import response_kind
+
+DEFAULT_HISTORY_FILE = 'release_history.jsonl'
+
+
+class ReleaseProfiler:
+    """
+    记录一次开抢中服务器的开放时刻，线程安全（多个任务可以共用）
+    :param resource_id: 资源ID
+    :param target_time: 预定的开放时间（datetime，即 --time）
+    :param clock: clock_sync.measure_clock_offset 的结果，用来把本地时间换算成服务器时间
+    """
+
+    def __init__(self, resource_id, target_time, clock=None):
+        self.resource_id = resource_id
+        self.target_time = target_time
+        self.clock = clock or {}
+        self.offset = self.clock.get('offset', 0.0)
+        self.last_not_open = None
+        self.first_accepted = None
+        self.first_taken = None
+        self.responses = 0
+        self._lock = threading.Lock()
+
+    def observe(self, result, sent_at, received_at):
+        """
+        记录一次 launch 响应，可以直接作为 make_reservation 的 on_response
+        :param sent_at: 发出请求时的本地时间戳
+        :param received_at: 收到响应时的本地时间戳
+        """
+        kind = response_kind(result)
+        if kind in ('throttled', 'busy'):
+            return
+        # 服务器处理请求的时刻一定在 [发出, 收到] 之间
+        window = (sent_at + self.offset, received_at + self.offset)
+        with self._lock:
+            self.responses += 1
+            if kind == 'not_open':
+                if self.last_not_open is None or window[0] > self.last_not_open[0]:
+                    self.last_not_open = window
+                return
+            if self.first_accepted is None or window[1] < self.first_accepted[1]:
+                self.first_accepted = window
+            if classify_response(result) == 'taken' and (self.first_taken is None or window[1] < self.first_taken[1]):
+                self.first_taken = window
+
+    def record(self):
+        """
+        本次的记录，时间都是相对 target_time 的秒数
+        open_lower/open_upper：开放时刻所在的区间；open_estimate：区间中点
+        """
+        target = self.target_time.timestamp()
+
+        def rel(ts):
+            return None if ts is None else round(ts - target, 4)
+
+        with self._lock:
+            lower = self.last_not_open[0] if self.last_not_open else None
+            upper = self.first_accepted[1] if self.first_accepted else None
+            taken = self.first_taken[1] if self.first_taken else None
+            responses = self.responses
+        estimate = None
+        if upper is not None:
+            estimate = (lower + upper) / 2 if lower is not None and lower < upper else upper
+        return {
+            "time": datetime.datetime.now().isoformat(timespec='seconds'),
+            "resource_id": str(self.resource_id),
+            "target": self.target_time.isoformat(sep=' '),
+            "open_lower": rel(lower),
+            "open_upper": rel(upper),
+            "open_estimate": rel(estimate),
+            "first_taken": rel(taken),
+            "clock_uncertainty": self.clock.get('uncertainty'),
+            "responses": responses,
+        }
+
+    def save(self, history_file=DEFAULT_HISTORY_FILE):
+        """把本次记录追加写入历史文件，返回记录；没有任何响应时不写"""
+        return save_record(self.record(), history_file)
+
+
+def save_record(record, history_file=DEFAULT_HISTORY_FILE):
+    """把一条记录追加写入历史文件并打印，返回记录；没有任何响应时不写"""
+    if not record['responses']:
+        return None
+    with open(history_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"[开放时刻] resource {record['resource_id']}：开放于 {_fmt(record['open_lower'])} ~ {_fmt(record['open_upper'])}，"
+          f"首次被抢 {_fmt(record['first_taken'])}（相对 {record['target']}）")
+    return record
+
+
+def merge_records(records):
+    """
+    合并同一次开放（resource_id 和 target 相同）在多个进程里的记录：
+    区间取最晚的下界和最早的上界，首次被抢取最早的
+    """
+    def pick(key, func):
+        values = [r[key] for r in records if r.get(key) is not None]
+        return func(values) if values else None
+
+    lower = pick('open_lower', max)
+    upper = pick('open_upper', min)
+    estimate = None
+    if upper is not None:
+        estimate = round((lower + upper) / 2, 4) if lower is not None and lower < upper else upper
+    return dict(records[0], open_lower=lower, open_upper=upper, open_estimate=estimate,
+                first_taken=pick('first_taken', min), clock_uncertainty=pick('clock_uncertainty', max),
+                responses=sum(r['responses'] for r in records))
+
+
+def _fmt(seconds):
+    return "未知" if seconds is None else f"{seconds * 1000:+.0f}ms"
+
+
+def load_history(history_file=DEFAULT_HISTORY_FILE, resource_id=None):
+    """读取历史记录，可按 resource_id 过滤"""
+    records = []
+    try:
+        with open(history_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if resource_id is None or record.get('resource_id') == str(resource_id):
+                    records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def suggest_lead(records, recent=10, margin=0.02):
+    """
+    按最近 recent 次记录建议 --lead（秒，正数表示比 --time 提前，负数表示推后）
+    以历史上最早的开放时刻为准，再多留 margin 秒和时钟误差，保证不晚于开放时刻到达；
+    只有没有下界的记录时按 --time 开放计算，不会建议推后
+    :return: dict，没有可用记录时返回 None
+    """
+    opens = [r for r in records if r.get('open_estimate') is not None][-recent:]
+    if not opens:
+        return None
+    estimates = [r['open_estimate'] for r in opens]
+    # 没有下界的记录（第一次提交就被受理）只说明开放时刻不晚于 open_upper，只能让 lead 更早，不能推后
+    bounded = [r['open_lower'] for r in opens if r.get('open_lower') is not None]
+    earliest = min(bounded) if bounded else 0.0
+    earliest = min([earliest] + [r['open_estimate'] for r in opens if r.get('open_lower') is None])
+    uncertainty = max((r.get('clock_uncertainty') or 0.0) for r in opens)
+    taken = [r['first_taken'] for r in opens if r.get('first_taken') is not None]
+    return {
+        "lead": round(-(earliest - margin - uncertainty), 3),
+        "samples": len(opens),
+        "earliest": round(earliest, 4),
+        "median": round(statistics.median(estimates), 4),
+        "latest": round(max(estimates), 4),
+        "first_taken_median": round(statistics.median(taken), 4) if taken else None,
+    }
+
+
+def print_suggestion(resource_id, history_file=DEFAULT_HISTORY_FILE):
+    """打印 resource_id 的建议值，返回 suggest_lead 的结果"""
+    suggestion = suggest_lead(load_history(history_file, resource_id))
+    if suggestion:
+        print(f"[开放时刻] resource {resource_id} 最近 {suggestion['samples']} 次开放于 "
+              f"{_fmt(suggestion['earliest'])} ~ {_fmt(suggestion['latest'])}（中位数 {_fmt(suggestion['median'])}），"
+              f"首次被抢中位数 {_fmt(suggestion['first_taken_median'])}，建议 --lead {suggestion['lead']}")
+    return suggestion
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查看开放时刻历史和 --lead 建议')
+    parser.add_argument('--resource_id', type=str, help='预约资源ID，不填则显示全部')
+    parser.add_argument('--history', type=str, default=DEFAULT_HISTORY_FILE, help='历史文件')
+    args = parser.parse_args()
+
+    records = load_history(args.history, args.resource_id)
+    if not records:
+        print("没有历史记录")
+        return
+    for r in records:
+        print(f"{r['time']}\tresource {r['resource_id']}\t开放 {_fmt(r['open_lower'])} ~ {_fmt(r['open_upper'])}\t"
+              f"首次被抢 {_fmt(r['first_taken'])}")
+    for resource_id in sorted({r['resource_id'] for r in records}):
+        if not print_suggestion(resource_id, args.history):
+            print(f"[开放时刻] resource {resource_id} 还没有记录到开放时刻")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+快速启动的单次预约
+
+cron 在开抢前启动 python try.py 时，要先导入 requests、解析 config.json、test_connection 打开一个socket、
+设置日志，然后才开始做有用的事情。这里分成两步：
+1. 提前编译：读取并校验 config.json，联网检查cookie、解析场地ID，把结果写成快照 reserve_snapshot.json
+       python reserve.py compile --date 2025-09-12
+2. 开抢时运行：只读取快照，不再访问 config.json 和场地数据，需要发请求时才导入 requests 等模块
+       python reserve.py run --time "2025-09-11 00:00:00"
+   check 只校验快照、不联网，可以用来测启动开销：
+       python reserve.py check
+快照在 config.json 修改后会失效，需要重新编译。启动开销的测试见 benchmark.py --startup-runs。
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+_started = time.perf_counter()
+
+DEFAULT_SNAPSHOT_FILE = 'reserve_snapshot.json'
+SNAPSHOT_VERSION = 1
+
+# 运行时用到的配置项：(类型, 默认值)，编译时校验并写进快照
+RUN_OPTIONS = {
+    "max_attempts": (int, 1000),
+    "retry_delay": (float, 0.1),
+    "request_timeout": (float, 10),
+    "adaptive_pacing": (bool, True),
+    "min_retry_delay": (float, None),
+    "max_retry_delay": (float, 2.0),
+    "fast_send": (bool, False),
+    "hedge_requests": (int, 1),
+    "hedge_delay": (float, 0.1),
+    "account_concurrency": (int, None),
+    "warmup_connections": (int, 4),
+    "warmup_lead": (float, 3),
+    "clock_sync": (bool, True),
+    "clock_sync_samples": (int, 12),
+    "clock_sync_refine": (int, 6),
+    "release_lead": (float, 0),
+    "progress_interval": (float, 0.2),
+}
+
+# 可以为负数的配置项：release_lead 为负表示比开放时间推后提交
+SIGNED_OPTIONS = {"release_lead"}
+
+
+def validate_options(config):
+    """
+    校验并补全运行配置
+    :return: (options, errors)，errors 为错误说明列表
+    """
+    options = {}
+    errors = []
+    for key, (kind, default) in RUN_OPTIONS.items():
+        value = config.get(key, default)
+        if value is None:
+            continue
+        if kind is bool:
+            ok = isinstance(value, bool)
+        elif kind is float:
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        else:
+            ok = isinstance(value, int) and not isinstance(value, bool)
+        if not ok:
+            errors.append(f"{key} 应为 {kind.__name__}，实际为 {value!r}")
+            continue
+        if kind is not bool and key not in SIGNED_OPTIONS and value < 0:
+            errors.append(f"{key} 不能为负数：{value}")
+            continue
+        options[key] = value
+    if options.get('max_attempts', 1) < 1:
+        errors.append("max_attempts 至少为1")
+    return options, errors
+
+
+def compile_snapshot(config_file='config.json', snapshot_file=DEFAULT_SNAPSHOT_FILE, date=None, resource_id=None,
+                     cookie_file='cookie.txt'):
+    """
+    读取 config.json，检查cookie并解析场地，写出快照
+    :return: 快照dict，失败时返回 None
+    """
+    from eportal import load_config, get_session_with_cookie, check_session
+    from margin_cache import get_layout
+    from slot_selector import select_candidates, candidates_from_ids
+
+    config = load_config(config_file)
+    if not config:
+        return None
+    options, errors = validate_options(config)
+    resource_id = resource_id or config.get('resource_id')
+    date = date or config.get('date')
+    slots = config.get('slots', 1)
+    selector = config.get('selector')
+    if not resource_id:
+        errors.append("缺少 resource_id")
+    if not date:
+        errors.append("缺少 date")
+    elif not _valid_date(date):
+        errors.append(f"date 格式错误：{date}，应为 YYYY-MM-DD")
+    if not isinstance(slots, int) or slots < 1:
+        errors.append(f"slots 应为正整数：{slots!r}")
+    id_pairs = [(config.get(f'period{n}'), config.get(f'sub_resource_id{n}')) for n in (1, 2)][:slots]
+    if not selector and (slots > 2 or not all(p and s for p, s in id_pairs)):
+        errors.append("没有配置 selector 时需要 period1/sub_resource_id1（slots 为2时还需要 period2/sub_resource_id2）")
+    if errors:
+        print("错误：配置校验失败：")
+        for error in errors:
+            print(f"- {error}")
+        return None
+
+    session = get_session_with_cookie(cookie_file)
+    if not session or not check_session(session):
+        print(f"{cookie_file} 中的cookie无效，请重新扫码登录并更新cookie")
+        return None
+    layout = get_layout(session, resource_id, date, config.get('margin_cache_ttl', 600))
+    try:
+        if selector:
+            candidates = select_candidates(layout, date, selector, slots)
+        else:
+            candidates = candidates_from_ids(layout, date, id_pairs, config.get('fallback_tables', []))
+    except ValueError as e:
+        print(f"错误：{e}")
+        return None
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "compiled_at": datetime.datetime.now().isoformat(timespec='seconds'),
+        "config_file": os.path.abspath(config_file),
+        "config_mtime": os.stat(config_file).st_mtime,
+        "cookie_file": os.path.abspath(cookie_file),
+        "resource_id": str(resource_id),
+        "date": date,
+        "candidates": candidates,
+        "options": options,
+    }
+    tmp_file = snapshot_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_file, snapshot_file)
+    print(f"已写入 {snapshot_file}：resource {resource_id}，{date}，{len(candidates)} 个候选")
+    return snapshot
+
+
+def _valid_date(text):
+    try:
+        datetime.datetime.strptime(text, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def load_snapshot(snapshot_file=DEFAULT_SNAPSHOT_FILE):
+    """
+    读取并检查快照：版本、config.json 是否修改过、预约日期是否已过
+    :return: 快照dict，无效时打印原因并返回 None
+    """
+    try:
+        with open(snapshot_file, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        print(f"错误：{snapshot_file} 不存在，请先运行 python reserve.py compile")
+        return None
+    except ValueError:
+        print(f"错误：{snapshot_file} 格式不正确，请重新编译")
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION or not snapshot.get('candidates'):
+        print(f"错误：{snapshot_file} 版本不匹配或没有候选，请重新编译")
+        return None
+    try:
+        stale = os.stat(snapshot['config_file']).st_mtime != snapshot['config_mtime']
+    except OSError:
+        stale = False
+    if stale:
+        print(f"错误：{snapshot['config_file']} 在编译之后修改过，请重新运行 python reserve.py compile")
+        return None
+    if snapshot['date'] < datetime.date.today().isoformat():
+        print(f"错误：快照中的预约日期 {snapshot['date']} 已过")
+        return None
+    return snapshot
+
+
+def run_snapshot(snapshot, target_time=None, lead=None):
+    """
+    按快照预约一次（没有外层重试），需要联网时才导入相关模块
+    :param target_time: 开放时间（datetime），None 表示立即提交
+    :param lead: 比 target_time 提前多少秒，None 时使用快照里的 release_lead
+    :return: 是否预约成功
+    """
+    t0 = time.perf_counter()
+    from eportal import get_session_with_cookie, wait_until
+    from prepared import PreparedReservation
+    from rate_control import pacer_from_config
+    from hedge import hedge_options
+    from log_queue import setup_logging
+    print(f"[启动] 导入模块 {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    options = snapshot['options']
+    # 与 try.py 相同：日志由后台线程写入 reservation.log，程序退出时（atexit）停止并写完剩余记录
+    setup_logging(progress_interval=options.get('progress_interval', 0.2))
+    session = get_session_with_cookie(snapshot['cookie_file'])
+    if not session:
+        return False
+    prepared = PreparedReservation(session, snapshot['resource_id'], snapshot['date'], snapshot['candidates'],
+                                   snapshot['cookie_file'])
+    if target_time:
+        from connection_pool import warm_up_session, wait_until_warm
+        from clock_sync import make_scheduler
+        warmup_connections = options.get('warmup_connections', 4)
+        warm_up_session(session, warmup_connections)
+        prepared.open_pages()
+        fire_time = target_time - datetime.timedelta(seconds=options.get('release_lead', 0) if lead is None else lead)
+        wait = wait_until
+        if options.get('clock_sync', True):
+            refine = options.get('clock_sync_refine', 6)
+            if (fire_time - datetime.datetime.now()).total_seconds() < refine + options.get('warmup_lead', 3) + 2:
+                refine = 0
+            wait = make_scheduler(session, options.get('clock_sync_samples', 12), refine_rounds=refine)
+        print(f"等待到指定时间：{target_time}")
+        wait_until_warm(session, fire_time, warmup_connections, options.get('warmup_lead', 3), wait=wait)
+        print()
+    return prepared.run(options.get('max_attempts', 1000), options.get('retry_delay', 0.1),
+                        options.get('request_timeout', 10), pacer=pacer_from_config(options),
+                        fast_send=options.get('fast_send', False), hedge=hedge_options(options))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='快速启动的单次预约')
+    sub = parser.add_subparsers(dest='command', required=True)
+    compile_parser = sub.add_parser('compile', help='校验 config.json、解析场地并写出快照（需要联网）')
+    compile_parser.add_argument('--config', type=str, default='config.json', help='配置文件')
+    compile_parser.add_argument('--date', type=str, help='预约日期，默认使用配置中的 date')
+    compile_parser.add_argument('--resource_id', type=str, help='预约资源ID，默认使用配置中的 resource_id')
+    compile_parser.add_argument('--cookie', type=str, default='cookie.txt', help='cookie文件')
+    run_parser = sub.add_parser('run', help='按快照预约一次')
+    run_parser.add_argument('--time', type=str, help='开放时间，格式：YYYY-MM-DD HH:MM:SS，不填则立即提交')
+    run_parser.add_argument('--lead', type=float, help='比 --time 提前多少秒开始提交，默认使用配置中的 release_lead')
+    sub.add_parser('check', help='只校验快照，不联网')
+    for p in (compile_parser, run_parser, sub.choices['check']):
+        p.add_argument('--snapshot', type=str, default=DEFAULT_SNAPSHOT_FILE, help='快照文件')
+    args = parser.parse_args()
+
+    if args.command == 'compile':
+        sys.exit(0 if compile_snapshot(args.config, args.snapshot, args.date, args.resource_id, args.cookie) else 1)
+
+    target_time = None
+    if args.command == 'run' and args.time:
+        try:
+            target_time = datetime.datetime.strptime(args.time, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            print("时间格式错误，请使用 'YYYY-MM-DD HH:MM:SS' 格式")
+            sys.exit(1)
+    snapshot = load_snapshot(args.snapshot)
+    if not snapshot:
+        sys.exit(1)
+    print(f"[启动] 载入快照 {(time.perf_counter() - _started) * 1000:.1f}ms：resource {snapshot['resource_id']}，"
+          f"{snapshot['date']}，{len(snapshot['candidates'])} 个候选")
+    if args.command == 'check':
+        return
+    try:
+        sys.exit(0 if run_snapshot(snapshot, target_time, args.lead) else 1)
+    except KeyboardInterrupt:
+        print("\n用户中断程序")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+声明式的场地选择
+
+无人值守运行（cron、systemd timer）时不能等待 input()。在 config.json 里写：
+
+    "selector": {
+        "times": ["19:00-21:00", "18:00-19:00"],
+        "courts": ["3号台", "5号台", "all"],
+        "prefer": "time"
+    }
+
+- times：时间范围，按优先级排列；开始时间落在范围内的时间段都算匹配（"19:00-20:00" 能匹配 "19:10-20:10"）。
+  slots 大于1时，在每个范围里取连续的 slots 个时间段
+- courts：台号名称，按优先级排列，与场地数据的 abscissa 完全一致或包含在其中（"3号" 匹配 "3号台"）；
+  "all" 表示其余全部台号。不填时等同于 ["all"]
+- prefer："time" 表示先保证时间（同一时间段换遍所有台号再换时间），"court" 表示先保证台号
+
+选择结果直接在 margin 数据上解析成候选列表，不需要任何输入。
+"""
+import re
+
+from eportal import build_candidates, build_reservations, fallback_table_order, slot_index
+
+TIME_RANGE_PATTERN = re.compile(r'(\d{1,2}):(\d{2})\s*[-~～—]\s*(\d{1,2}):(\d{2})')
+
+
+def parse_time_range(text):
+    """把 "19:00-20:00" 解析成 (开始分钟数, 结束分钟数)，格式不对时抛出 ValueError"""
+    match = TIME_RANGE_PATTERN.search(text)
+    if not match:
+        raise ValueError(f"时间范围格式错误：{text}，应为 HH:MM-HH:MM")
+    h1, m1, h2, m2 = map(int, match.groups())
+    return h1 * 60 + m1, h2 * 60 + m2
+
+
+def match_time_windows(layout, time_ranges, slots=1):
+    """
+    按时间范围找出要预约的时间段
+    :param time_ranges: 时间范围列表，按优先级排列
+    :param slots: 每次预约连续的时间段数
+    :return: 时间段序号列表的列表，例如 [[11, 12], [12, 13]]，已去重并保持优先级
+    """
+    starts = [parse_time_range(y)[0] for y in layout['yaxis']]
+    windows = []
+    for text in time_ranges:
+        begin, end = parse_time_range(text)
+        matched = [i for i, start in enumerate(starts) if begin <= start < end]
+        for k in range(len(matched) - slots + 1):
+            window = matched[k:k + slots]
+            # 只要序号连续的时间段
+            if window[-1] - window[0] == slots - 1 and window not in windows:
+                windows.append(window)
+    return windows
+
+
+def match_courts(layout, courts):
+    """
+    按台号名称找出台号序号
+    :param courts: 台号名称列表，按优先级排列，"all" 表示其余全部台号
+    :return: 台号序号列表
+    """
+    abscissa = layout['abscissa']
+    order = []
+    for name in courts or ["all"]:
+        if name in ("all", "*"):
+            matched = range(len(abscissa))
+        elif name in abscissa:
+            matched = [abscissa.index(name)]
+        else:
+            matched = [i for i, a in enumerate(abscissa) if name in a]
+            if not matched:
+                print(f"[警告] 台号 {name} 不在场地数据中，已忽略")
+        for idx in matched:
+            if idx not in order:
+                order.append(idx)
+    return order
+
+
+def select_candidates(layout, date, selector, slots=1):
+    """
+    按 selector 在场地布局上生成候选列表
+    :param selector: config.json 里的 selector，见模块说明
+    :param slots: 每次预约连续的时间段数
+    :return: 候选列表，每个候选是一个预约信息列表
+    :raises ValueError: 没有任何匹配的场地
+    """
+    times = selector.get('times', [])
+    courts = selector.get('courts')
+    windows = match_time_windows(layout, [times] if isinstance(times, str) else times, slots)
+    courts = match_courts(layout, [courts] if isinstance(courts, str) else courts)
+    if selector.get('prefer', 'time') == 'court':
+        pairs = [(w, s) for s in courts for w in windows]
+    else:
+        pairs = [(w, s) for w in windows for s in courts]
+    index = slot_index(layout)
+    candidates = []
+    for t_indices, s_idx in pairs:
+        try:
+            candidates.append(build_reservations(layout, date, t_indices, s_idx, index))
+        except ValueError:
+            continue
+    if not candidates:
+        raise ValueError(f"selector 没有匹配到任何场地：{selector}")
+    return candidates
+
+
+def find_slot(layout, period, sub_resource_id):
+    """按真实ID反查 (时间段序号, 台号序号)，找不到时返回 None"""
+    for yaxis, abscissa, time_id, sub_id in layout['slots']:
+        if str(time_id) == str(period) and str(sub_id) == str(sub_resource_id):
+            return layout['yaxis'].index(yaxis), layout['abscissa'].index(abscissa)
+    return None
+
+
+def candidates_from_ids(layout, date, id_pairs, fallback_tables=None):
+    """
+    直接使用给定的 (period, sub_resource_id)，例如命令行的 --period1/--sub_resource_id1
+    这些ID能在场地数据中找到、且是同一个台号时，按 fallback_tables 追加候选台号
+    :return: 候选列表
+    """
+    reservations = [{"date": date, "period": int(period), "sub_resource_id": int(sub_id)} for period, sub_id in id_pairs]
+    located = [find_slot(layout, period, sub_id) for period, sub_id in id_pairs]
+    if not all(located):
+        print("[警告] 给定的ID不在场地数据中，按原样提交")
+        return [reservations]
+    tables = {s_idx for _, s_idx in located}
+    if not fallback_tables or len(tables) != 1:
+        return [reservations]
+    t_indices = [t_idx for t_idx, _ in located]
+    return build_candidates(layout, date, t_indices, fallback_table_order(layout, located[0][1], fallback_tables))
@@ -0,0 +1,73 @@
+"""
+导出场地ID对照表
+
+按 margin 数据生成和「场馆resource_id，period,sub_resource_id.xlsx」同样格式的表格：
+第一行是 场馆名+resource_id、period、各台号，之后每行是 时间段、period、各台号的 sub_resource_id。
+导出 .xlsx 需要安装 openpyxl（pip install openpyxl），导出 .csv 不需要额外依赖。
+
+用法：
+    python slot_table.py --resource_id 57 --date 2025-09-12 --output 57.xlsx
+"""
+import argparse
+import csv
+
+from eportal import get_session_with_cookie, slot_index
+from margin_cache import get_layout
+
+
+def build_slot_rows(layout, title):
+    """把场地布局整理成表格的行（列表的列表）"""
+    index = slot_index(layout)
+    rows = [[title, 'period'] + list(layout['abscissa'])]
+    for yaxis in layout['yaxis']:
+        periods = [index[(yaxis, a)][0] for a in layout['abscissa'] if (yaxis, a) in index]
+        row = [yaxis, periods[0] if periods else None]
+        for abscissa in layout['abscissa']:
+            ids = index.get((yaxis, abscissa))
+            row.append(ids[1] if ids else None)
+        rows.append(row)
+    return rows
+
+
+def export_slot_table(layout, path, title):
+    """
+    导出场地ID对照表
+    :param layout: 场地布局，见 eportal.parse_margin_layout
+    :param path: 输出文件，.csv 或 .xlsx
+    :param title: 表头第一格，例如 南校区羽毛球馆57
+    """
+    rows = build_slot_rows(layout, title)
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            csv.writer(f).writerows(rows)
+        return
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("导出xlsx需要openpyxl，请先执行 pip install openpyxl，或改为导出 .csv")
+    wb = Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出场地 period/sub_resource_id 对照表')
+    parser.add_argument('--resource_id', type=str, required=True, help='预约资源ID')
+    parser.add_argument('--date', type=str, required=True, help='日期，格式：YYYY-MM-DD')
+    parser.add_argument('--output', type=str, required=True, help='输出文件（.xlsx 或 .csv）')
+    parser.add_argument('--title', type=str, help='表头第一格，默认为 resource_id')
+    parser.add_argument('--cookie', type=str, default='cookie.txt', help='cookie文件')
+    args = parser.parse_args()
+
+    session = get_session_with_cookie(args.cookie)
+    if not session:
+        return
+    layout = get_layout(session, args.resource_id, args.date)
+    export_slot_table(layout, args.output, args.title or args.resource_id)
+    print(f"已导出 {len(layout['yaxis'])} 个时间段 × {len(layout['abscissa'])} 个台号 到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,242 +1,173 @@
-﻿import requests
-import time
+﻿import time
 import datetime
-import socket
-import json
-import re
 import argparse
-import os
 import sys
 import logging
+import atexit
+
+from eportal import (
+    parse_time,
+    wait_until,
+    load_config,
+    layout_options,
+    lookup_slot,
+    fallback_table_order,
+    build_candidates,
+)
+from slot_selector import select_candidates, candidates_from_ids
+from prepared import prepare_reservation, CookieInvalidError
+from connection_pool import warm_up_session, wait_until_warm
+from clock_sync import make_scheduler
+from availability import AvailabilityPoller
+from keepalive import SessionKeeper
+from release_profile import ReleaseProfiler, DEFAULT_HISTORY_FILE, print_suggestion
+from rate_control import pacer_from_config
+from hedge import hedge_options
+from metrics import LatencyRecorder
+from log_queue import setup_logging as setup_queue_logging
 
 # 配置日志
-def setup_logging():
-    """设置日志配置"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('reservation.log', encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+def setup_logging(progress_interval=0.2):
+    """设置日志配置：json日志由后台线程写入 reservation.log，不阻塞提交"""
+    setup_queue_logging('reservation.log', progress_interval=progress_interval)
     return logging.getLogger(__name__)
 
-def test_connection():
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5)
-        sock.connect(('eportal.hnu.edu.cn', 443))
-        sock.close()
-        return True
-    except:
-        return False
-
-# 新增：读取cookie.txt并返回cookie字典
-def load_cookie_from_file(cookie_file='cookie.txt'):
-    try:
-        with open(cookie_file, 'r', encoding='utf-8') as f:
-            cookie_str = f.read().strip()
-        cookies = {}
-        for item in cookie_str.split(';'):
-            if '=' in item:
-                k, v = item.strip().split('=', 1)
-                cookies[k] = v
-        return cookies
-    except Exception as e:
-        print(f"读取cookie失败: {e}")
-        return None
+def prompt_slots(layout, slots):
+    """
+    打印可选时间段和台号并等待输入
+    :return: (t_indices, s_idx)
+    """
+    time_options, table_options, base_time_id, base_sub_id = layout_options(layout)
+    print("可选时间段：")
+    for idx, name in time_options:
+        print(f"{idx}. {name}")
+    print("可选台号：")
+    for idx, name in table_options:
+        print(f"{idx}. {name}")
+    t_idx = int(input("请输入你想预约的时间段序号（如0）："))
+    s_idx = int(input("请输入你想预约的台号序号（如0）："))
+    time_count = len(time_options)
+    print(f"[调试] 当前时间段总数 time_count = {time_count}")
+    t_indices = list(range(t_idx, t_idx + slots))
+    print(f"[调试] base_time_id = {base_time_id}, base_sub_id = {base_sub_id}")
+    for n, idx in enumerate(t_indices, 1):
+        period, sub_resource_id = lookup_slot(layout, idx, s_idx)
+        print(f"[调试] period{n} = {period}, sub_resource_id{n} = {sub_resource_id}")
+    return t_indices, s_idx
 
-# 新增：用cookie构造session
-def get_session_with_cookie(cookie_file='cookie.txt'):
-    session = requests.Session()
-    cookies = load_cookie_from_file(cookie_file)
-    if not cookies:
-        print("未能加载cookie，无法继续")
-        return None
-    session.cookies.update(cookies)
-    return session
 
-def make_reservation(session, reservations, resource_id, max_attempts=1000, retry_delay=0.1, request_timeout=10):
+def slot_chooser(config, slots, id_pairs=None):
     """
-    进行预约，支持重试机制
-    :param session: 会话对象
-    :param reservations: 预约信息列表
-    :param resource_id: 资源ID
-    :param max_attempts: 最大尝试次数
-    :param retry_delay: 重试间隔（秒）
-    :return: 是否预约成功
+    决定怎样选择场地，返回 choose_candidates(layout, date) 函数：
+    配置了 selector 时按 selector 解析；给出了 period/sub_resource_id 时直接使用；否则提示输入
     """
-    if not session:
-        print("未登录，无法进行预约")
-        return False
-        
-    hall_url = "https://eportal.hnu.edu.cn/v2/reserve/hallView?id=10"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive"
-    }
-    
-    try:
-        session.get(hall_url, headers=headers)
-        
-        detail_url = f"https://eportal.hnu.edu.cn/v2/reserve/reserveDetail?id={resource_id}"
-        session.get(detail_url, headers=headers)
-        
-        reserve_url = "https://eportal.hnu.edu.cn/site/reservation/launch"
-        reserve_headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-            "Accept": "application/json, text/plain, */*",
-            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Origin": "https://eportal.hnu.edu.cn",
-            "Referer": detail_url,
-            "Connection": "keep-alive"
-        }
-        
-        data = {
-            "resource_id": resource_id,
-            "code": "",
-            "remarks": "",
-            "deduct_num": "",
-            "data": json.dumps(reservations)
-        }
-        
-        attempt_count = 0
-        start_time = datetime.datetime.now()
-        
-        while attempt_count < max_attempts:
-            attempt_count += 1
-            current_time = datetime.datetime.now()
-            elapsed_time = (current_time - start_time).total_seconds()
-            
-            print(f"\r尝试第 {attempt_count} 次预约，已用时 {elapsed_time:.1f}秒", end="")
-            
-            try:
-                response = session.post(reserve_url, headers=reserve_headers, data=data, timeout=request_timeout)
-                result = response.json()
-                
-                if result.get('e') == 0:
-                    print(f"\n预约成功！预约ID：{result['d']['appointment_id']}")
-                    return True
-                else:
-                    error_msg = result.get('m', '未知错误')
-                    # 对于可重试的错误，继续尝试
-                    if error_msg in ["参数错误", "预约日期未达到", "点击太频繁了", "同一时间段不可重复预约", "系统繁忙", "网络错误"]:
-                        time.sleep(retry_delay)
-                        continue
-                    # 对于不可重试的错误，记录但继续尝试
-                    else:
-                        print(f"\n[警告] 预约失败：{error_msg}，继续尝试...")
-                        time.sleep(retry_delay)
-                        continue
-                        
-            except requests.exceptions.Timeout:
-                print(f"\n[警告] 请求超时，继续尝试...")
-                time.sleep(retry_delay)
-                continue
-            except requests.exceptions.ConnectionError:
-                print(f"\n[警告] 连接错误，继续尝试...")
-                time.sleep(retry_delay)
-                continue
-            except json.JSONDecodeError:
-                print(f"\n[警告] 响应解析错误，继续尝试...")
-                time.sleep(retry_delay)
-                continue
-            except Exception as e:
-                print(f"\n[警告] 请求异常：{str(e)}，继续尝试...")
-                time.sleep(retry_delay)
-                continue
-        
-        print(f"\n达到最大尝试次数（{max_attempts}次），预约失败")
-        return False
-            
-    except Exception as e:
-        print(f"\n预约请求初始化失败：{str(e)}")
-        return False
+    fallback_tables = config.get('fallback_tables', [])  # 首选台号被约走后依次尝试的台号，"all"表示全部
+    selector = config.get('selector')
+    if selector:
+        print(f"按配置选择场地：{selector}")
+        return lambda layout, date: select_candidates(layout, date, selector, slots)
+    if id_pairs:
+        print(f"使用给定的ID：{id_pairs}")
+        return lambda layout, date: candidates_from_ids(layout, date, id_pairs, fallback_tables)
 
-def parse_time(time_str):
-    try:
-        target_time = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-        return target_time
-    except ValueError:
-        print("时间格式错误，请使用 'YYYY-MM-DD HH:MM:SS' 格式")
-        return None
+    def prompt_candidates(layout, date):
+        t_indices, s_idx = prompt_slots(layout, slots)
+        return build_candidates(layout, date, t_indices, fallback_table_order(layout, s_idx, fallback_tables))
+    return prompt_candidates
 
-def wait_until(target_time):
-    while True:
-        current_time = datetime.datetime.now()
-        if current_time >= target_time:
-            return
-        time_diff = (target_time - current_time).total_seconds()
-        if time_diff > 0:
-            print(f"\r距离预约开始还有: {time_diff:.1f}秒", end="")
-            time.sleep(0.1)
 
-def load_config():
-    try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            return config
-    except FileNotFoundError:
-        print("错误：配置文件 config.json 不存在")
-        return {}
-    except json.JSONDecodeError:
-        print("错误：配置文件格式不正确")
-        return {}
-    except Exception as e:
-        print(f"读取配置文件时发生错误：{str(e)}")
-        return {}
+def prepare_with_retry(logger, resource_id, date, choose_candidates, config, recorder=None):
+    """
+    开抢前只准备一次：测试网络、加载并检查cookie、拉取场地布局、选择场地、编码表单
+    网络不通或输入有误时按 max_retries / retry_interval 重试
+    :param choose_candidates: 见 slot_chooser
+    :return: PreparedReservation，失败时返回 None
+    """
+    max_retries = config.get('max_retries', 10)
+    retry_interval = config.get('retry_interval', 5)
+    for attempt in range(1, max_retries + 1):
+        try:
+            target_date = date if date else datetime.datetime.now().strftime("%Y-%m-%d")
+            prepared = prepare_reservation(resource_id, target_date, choose_candidates,
+                                           config.get('margin_cache_ttl', 600), recorder=recorder)
+            if prepared:
+                return prepared
+        except CookieInvalidError as e:
+            print(f"{e}，程序退出")
+            return None
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            logger.error(f"准备预约时发生错误：{str(e)}")
+            print(f"准备预约时发生错误：{str(e)}")
+        print(f"第 {attempt} 次准备失败，{retry_interval}秒后重试...")
+        time.sleep(retry_interval)
+    return None
 
-def fetch_time_and_table_options(session, resource_id, date):
+
+def run_prepared(logger, prepared, config, pacer, mode="", on_response=None):
     """
-    拉取可预约时间段和台号，返回基础time_id、sub_id和展示列表
-    只展示每种不同的时间段一次，台号遍历所有key下所有台号
+    用准备好的预约反复提交，外层重试之间不再重新准备
+    :param mode: 日志里附加的模式说明，例如「（命令行模式）」
+    :param on_response: 可选，见 make_reservation，例如 ReleaseProfiler.observe
+    :return: 是否预约成功
     """
-    url = f"https://eportal.hnu.edu.cn/site/reservation/resource-info-margin?resource_id={resource_id}&start_time={date}&end_time={date}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-        "Accept": "application/json, text/plain, */*",
-        "Referer": f"https://eportal.hnu.edu.cn/v2/reserve/reserveDetail?id={resource_id}",
-        "Connection": "keep-alive"
-    }
-    resp = session.get(url, headers=headers, verify=False)
-    data = resp.json()
-    d = data['d']
-    # 只用第一个台号的时间段，且只显示每种时间段一次
-    first_key = list(d.keys())[0]
-    time_list = d[first_key]
-    time_options = []
-    last_yaxis = None
-    for t in time_list:
-        if t['yaxis'] != last_yaxis:
-            time_options.append((len(time_options), t['yaxis']))
-            last_yaxis = t['yaxis']
-    base_time_id = time_list[0]['time_id']
-    # 台号列表，遍历所有key下所有台号，去重
-    table_options = []
-    abscissa_set = set()
-    base_sub_id = None
-    for vlist in d.values():
-        for v in vlist:
-            abscissa = v['abscissa']
-            if abscissa not in abscissa_set:
-                table_options.append((len(table_options), abscissa))
-                abscissa_set.add(abscissa)
-                if base_sub_id is None:
-                    base_sub_id = v['sub_id']
-    return time_options, table_options, base_time_id, base_sub_id
+    max_retries = config.get('max_retries', 10)  # 最大重试次数
+    retry_interval = config.get('retry_interval', 5)  # 重试间隔（秒）
+    max_attempts = config.get('max_attempts', 1000)
+    retry_delay = config.get('retry_delay', 0.1)
+    request_timeout = config.get('request_timeout', 10)
+    availability_poll_interval = config.get('availability_poll_interval', 0)  # 余量轮询间隔（秒），0表示不轮询
+    fast_send = config.get('fast_send', False)  # 是否用预先编码好的请求提交
+    hedge = hedge_options(config)  # 对冲提交参数，None表示不对冲
+
+    retry_count = 0
+    while retry_count < max_retries:
+        try:
+            retry_count += 1
+            print(f"\n=== 第 {retry_count} 次尝试预约{mode}===")
+            poller = None
+            if availability_poll_interval > 0:
+                poller = AvailabilityPoller(prepared.session, prepared.resource_id, prepared.date, availability_poll_interval)
+                poller.start()
+            try:
+                success = prepared.run(max_attempts, retry_delay, request_timeout, pacer=pacer,
+                                       is_available=poller.candidate_available if poller else None, fast_send=fast_send,
+                                       hedge=hedge, on_response=on_response)
+            finally:
+                if poller:
+                    poller.stop()
+            logger.info(f"重试间隔统计：{pacer.stats()}")
+            if success:
+                logger.info(f"预约成功！程序结束{mode}")
+                print("预约成功！程序结束")
+                return True
+            logger.warning(f"第 {retry_count} 次尝试失败{mode}，{retry_interval}秒后重试...")
+            print(f"第 {retry_count} 次尝试失败，{retry_interval}秒后重试...")
+            time.sleep(retry_interval)
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            logger.error(f"程序发生错误{mode}：{str(e)}")
+            print(f"程序发生错误：{str(e)}")
+            print(f"第 {retry_count} 次尝试失败，{retry_interval}秒后重试...")
+            time.sleep(retry_interval)
+            # 只有出错时才重新建立会话
+            if not prepared.reconnect():
+                print("cookie已失效，请重新扫码登录并复制cookie")
+                return False
+
+    logger.error(f"达到最大重试次数（{max_retries}次），程序结束{mode}")
+    print(f"达到最大重试次数（{max_retries}次），程序结束")
+    return False
+
 
 def main():
+    config = load_config()
     # 设置日志
-    logger = setup_logging()
+    logger = setup_logging(config.get('progress_interval', 0.2) if config else 0.2)
     logger.info("程序启动")
     
-    config = load_config()
     if not config:
         logger.error("无法读取配置文件，请确保config.json存在且格式正确")
         print("错误：无法读取配置文件，请确保config.json存在且格式正确")
@@ -245,8 +176,27 @@ def main():
     # 从配置文件读取重试参数
     max_retries = config.get('max_retries', 10)  # 最大重试次数
     retry_interval = config.get('retry_interval', 5)  # 重试间隔（秒）
+    warmup_connections = config.get('warmup_connections', 4)  # 预热连接数，0表示不预热
+    warmup_lead = config.get('warmup_lead', 3)  # 开始前多少秒刷新连接
+    clock_sync = config.get('clock_sync', True)  # 是否按服务器时间定时
+    clock_sync_samples = config.get('clock_sync_samples', 12)  # 校时采样次数
+    clock_sync_refine = config.get('clock_sync_refine', 6)  # 校时二分轮数，0表示不二分
+    release_history_file = config.get('release_history_file', DEFAULT_HISTORY_FILE)  # 开放时刻历史，空字符串表示不记录
+    keepalive_interval = config.get('keepalive_interval', 300)  # 等待开抢期间的保活间隔（秒），0表示不保活
     
     logger.info(f"配置参数：max_retries={max_retries}, retry_interval={retry_interval}")
+    # 自适应重试间隔在外层重试之间共用，限流后的退避状态不会因为重新开始而丢失
+    pacer = pacer_from_config(config)
+
+    # 请求耗时统计，程序退出时输出汇总并写入 metrics_file
+    metrics_file = config.get('metrics_file')
+    recorder = LatencyRecorder() if metrics_file else None
+    if recorder:
+        def write_metrics():
+            recorder.print_summary()
+            recorder.write_jsonl(metrics_file, {"argv": sys.argv[1:], "pacer": pacer.stats()})
+            logger.info(f"请求耗时统计已写入 {metrics_file}")
+        atexit.register(write_metrics)
     
     if len(sys.argv) == 1:
         print("使用cookie.txt中的cookie进行预约")
@@ -257,112 +207,24 @@ def main():
             print("错误：预约资源ID为必填项，请在config.json中配置resource_id")
             return
         
-        # 外层重试循环
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                retry_count += 1
-                print(f"\n=== 第 {retry_count} 次尝试预约 ===")
-                
-                current_time = datetime.datetime.now()
-                if not test_connection():
-                    print("网络连接测试失败，请检查网络")
-                    time.sleep(retry_interval)
-                    continue
-                    
-                print("加载cookie...")
-                session = get_session_with_cookie()
-                if not session:
-                    print("cookie无效，程序退出")
-                    return
-                    
-                # 检查cookie是否有效（尝试访问个人主页）
-                check_url = "https://eportal.hnu.edu.cn/v2/site/index"
-                resp = session.get(check_url)
-                if '登录' in resp.text or resp.url.startswith('http://cas.hnu.edu.cn'):
-                    print("cookie已失效，请重新扫码登录并复制cookie")
-                    return
-                    
-                target_date = date if date else current_time.strftime("%Y-%m-%d")
-                # 拉取可选项
-                time_options, table_options, base_time_id, base_sub_id = fetch_time_and_table_options(session, resource_id, target_date)
-                print("可选时间段：")
-                for idx, name in time_options:
-                    print(f"{idx}. {name}")
-                print("可选台号：")
-                for idx, name in table_options:
-                    print(f"{idx}. {name}")
-                t_idx = int(input("请输入你想预约的时间段序号（如0）："))
-                s_idx = int(input("请输入你想预约的台号序号（如0）："))
-                time_count = len(time_options)
-                print(f"[调试] 当前时间段总数 time_count = {time_count}")
-                period1 = base_time_id + t_idx
-                sub_resource_id1 = base_sub_id + time_count * s_idx - t_idx
-                if slots == 2:
-                    t_idx2 = t_idx + 1
-                    s_idx2 = s_idx
-                if slots == 1:
-                    reservations = [
-                        {
-                            "date": target_date,
-                            "period": period1,
-                            "sub_resource_id": sub_resource_id1
-                        }
-                    ]
-                else:
-                    period2 = base_time_id + t_idx2
-                    sub_resource_id2 = base_sub_id + time_count * s_idx2 - t_idx2
-                    reservations = [
-                        {
-                            "date": target_date,
-                            "period": period1,
-                            "sub_resource_id": sub_resource_id1
-                        },
-                        {
-                            "date": target_date,
-                            "period": period2,
-                            "sub_resource_id": sub_resource_id2
-                        }
-                    ]
-                print(f"[调试] base_time_id = {base_time_id}, base_sub_id = {base_sub_id}")
-                print(f"[调试] period1 = {period1}, sub_resource_id1 = {sub_resource_id1}")
-                if slots == 2:
-                    print(f"[调试] period2 = {period2}, sub_resource_id2 = {sub_resource_id2}")
-                    
-                # 从配置文件读取重试参数
-                max_attempts = config.get('max_attempts', 1000)
-                retry_delay = config.get('retry_delay', 0.1)
-                request_timeout = config.get('request_timeout', 10)
-                
-                success = make_reservation(session, reservations, resource_id, max_attempts, retry_delay, request_timeout)
-                if success:
-                    logger.info("预约成功！程序结束")
-                    print("预约成功！程序结束")
-                    return
-                else:
-                    logger.warning(f"第 {retry_count} 次尝试失败，{retry_interval}秒后重试...")
-                    print(f"第 {retry_count} 次尝试失败，{retry_interval}秒后重试...")
-                    time.sleep(retry_interval)
-                    
-            except KeyboardInterrupt:
-                logger.info("用户中断程序")
-                print("\n用户中断程序")
+        try:
+            prepared = prepare_with_retry(logger, resource_id, date, slot_chooser(config, slots), config, recorder)
+            if not prepared:
                 return
-            except Exception as e:
-                logger.error(f"程序发生错误：{str(e)}")
-                print(f"程序发生错误：{str(e)}")
-                print(f"第 {retry_count} 次尝试失败，{retry_interval}秒后重试...")
-                time.sleep(retry_interval)
-                
-        logger.error(f"达到最大重试次数（{max_retries}次），程序结束")
-        print(f"达到最大重试次数（{max_retries}次），程序结束")
+            warm_up_session(prepared.session, warmup_connections)
+            run_prepared(logger, prepared, config, pacer)
+        except KeyboardInterrupt:
+            logger.info("用户中断程序")
+            print("\n用户中断程序")
         return
     # 命令行参数模式同样用cookie
     parser = argparse.ArgumentParser(description='体育馆预约程序')
     parser.add_argument('--time', type=str, help='预约开始时间，格式：YYYY-MM-DD HH:MM:SS')
+    parser.add_argument('--lead', type=str, default=str(config.get('release_lead', 0)),
+                        help='比 --time 提前多少秒开始提交（负数表示推后），auto 表示按开放时刻历史自动选择')
     parser.add_argument('--date', type=str, default=config.get('date'), help='预约日期，格式：YYYY-MM-DD')
     parser.add_argument('--resource_id', type=str, default=config.get('resource_id'), help='预约资源ID')
-    parser.add_argument('--slots', type=int, choices=[1, 2], default=config.get('slots', 1), help='预约时间段数量：1或2（默认1）')
+    parser.add_argument('--slots', type=int, default=config.get('slots', 1), help='预约连续的时间段数量（默认1），大于2时需要配置 selector')
     parser.add_argument('--period1', type=str, default=config.get('period1'), help='第一个时间段ID')
     parser.add_argument('--sub_resource_id1', type=str, default=config.get('sub_resource_id1'), help='第一个台号ID')
     parser.add_argument('--period2', type=str, default=config.get('period2'), help='第二个时间段ID')
@@ -372,11 +234,16 @@ def main():
     missing_params = []
     if not args.resource_id:
         missing_params.append("预约资源ID")
-    if not args.period1:
+    # 配置了 selector 时按 selector 选择场地，不需要ID
+    need_ids = not config.get('selector')
+    if need_ids and not args.period1:
         missing_params.append("第一个时间段ID")
-    if not args.sub_resource_id1:
+    if need_ids and not args.sub_resource_id1:
         missing_params.append("第一个台号ID")
-    if args.slots == 2:
+    if args.slots < 1 or (need_ids and args.slots > 2):
+        print("错误：--slots 至少为1，命令行ID只能指定2个时间段，更多时间段请在config.json中配置 selector")
+        return
+    if need_ids and args.slots == 2:
         if not args.period2:
             missing_params.append("第二个时间段ID")
         if not args.sub_resource_id2:
@@ -389,109 +256,63 @@ def main():
         print("1. 在config.json中配置")
         print("2. 通过命令行参数提供")
         return
-    # 命令行模式的重试循环
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            retry_count += 1
-            print(f"\n=== 第 {retry_count} 次尝试预约（命令行模式）===")
-            
-            current_time = datetime.datetime.now()
-            if not test_connection():
-                print("网络连接测试失败，请检查网络")
-                time.sleep(retry_interval)
-                continue
-                
-            print("加载cookie...")
-            session = get_session_with_cookie()
-            if not session:
-                print("cookie无效，程序退出")
-                return
-                
-            check_url = "https://eportal.hnu.edu.cn/v2/site/index"
-            resp = session.get(check_url)
-            if '登录' in resp.text or resp.url.startswith('http://cas.hnu.edu.cn'):
-                print("cookie已失效，请重新扫码登录并复制cookie")
-                return
-                
-            target_date = args.date if args.date else current_time.strftime("%Y-%m-%d")
-            time_options, table_options, base_time_id, base_sub_id = fetch_time_and_table_options(session, args.resource_id, target_date)
-            print("可选时间段：")
-            for idx, name in time_options:
-                print(f"{idx}. {name}")
-            print("可选台号：")
-            for idx, name in table_options:
-                print(f"{idx}. {name}")
-            t_idx = int(input("请输入你想预约的时间段序号（如0）："))
-            s_idx = int(input("请输入你想预约的台号序号（如0）："))
-            if args.slots == 2:
-                t_idx2 = t_idx + 1
-                s_idx2 = s_idx
-            if args.time:
-                target_time = parse_time(args.time)
-                if not target_time:
-                    return
-                print(f"等待到指定时间：{target_time}")
-                wait_until(target_time)
-            time_count = len(time_options)
-            print(f"[调试] 当前时间段总数 time_count = {time_count}")
-            period1 = base_time_id + t_idx
-            sub_resource_id1 = base_sub_id + time_count * s_idx - t_idx
-            if args.slots == 2:
-                period2 = base_time_id + t_idx2
-                sub_resource_id2 = base_sub_id + time_count * s_idx2 - t_idx2
-            print(f"[调试] base_time_id = {base_time_id}, base_sub_id = {base_sub_id}")
-            print(f"[调试] period1 = {period1}, sub_resource_id1 = {sub_resource_id1}")
-            if args.slots == 2:
-                print(f"[调试] period2 = {period2}, sub_resource_id2 = {sub_resource_id2}")
-            if args.slots == 1:
-                reservations = [
-                    {
-                        "date": target_date,
-                        "period": period1,
-                        "sub_resource_id": sub_resource_id1
-                    }
-                ]
-            else:
-                reservations = [
-                    {
-                        "date": target_date,
-                        "period": period1,
-                        "sub_resource_id": sub_resource_id1
-                    },
-                    {
-                        "date": target_date,
-                        "period": period2,
-                        "sub_resource_id": sub_resource_id2
-                    }
-                ]
-            # 从配置文件读取重试参数
-            max_attempts = config.get('max_attempts', 1000)
-            retry_delay = config.get('retry_delay', 0.1)
-            request_timeout = config.get('request_timeout', 10)
-            
-            success = make_reservation(session, reservations, args.resource_id, max_attempts, retry_delay, request_timeout)
-            if success:
-                logger.info("预约成功！程序结束（命令行模式）")
-                print("预约成功！程序结束")
+    target_time = None
+    lead = 0.0
+    if args.time:
+        target_time = parse_time(args.time)
+        if not target_time:
+            return
+        suggestion = print_suggestion(args.resource_id, release_history_file) if release_history_file else None
+        if args.lead == 'auto':
+            lead = suggestion['lead'] if suggestion else 0.0
+        else:
+            try:
+                lead = float(args.lead)
+            except ValueError:
+                print("--lead 应为秒数或 auto")
                 return
-            else:
-                logger.warning(f"第 {retry_count} 次尝试失败（命令行模式），{retry_interval}秒后重试...")
-                print(f"第 {retry_count} 次尝试失败，{retry_interval}秒后重试...")
-                time.sleep(retry_interval)
-                
-        except KeyboardInterrupt:
-            logger.info("用户中断程序（命令行模式）")
-            print("\n用户中断程序")
+
+    try:
+        # 先查好ID、编码好表单再等待，等待结束后直接提交
+        id_pairs = [(args.period1, args.sub_resource_id1)]
+        if args.slots == 2:
+            id_pairs.append((args.period2, args.sub_resource_id2))
+        choose_candidates = slot_chooser(config, args.slots, id_pairs)
+        prepared = prepare_with_retry(logger, args.resource_id, args.date, choose_candidates, config, recorder)
+        if not prepared:
             return
-        except Exception as e:
-            logger.error(f"程序发生错误（命令行模式）：{str(e)}")
-            print(f"程序发生错误：{str(e)}")
-            print(f"第 {retry_count} 次尝试失败，{retry_interval}秒后重试...")
-            time.sleep(retry_interval)
-            
-    logger.error(f"达到最大重试次数（{max_retries}次），程序结束（命令行模式）")
-    print(f"达到最大重试次数（{max_retries}次），程序结束")
+        profiler = None
+        if target_time:
+            warm_up_session(prepared.session, warmup_connections)
+            prepared.open_pages()
+            fire_time = target_time - datetime.timedelta(seconds=lead)
+            # 离开始太近时不做二分，避免校时本身错过开始时间
+            refine = clock_sync_refine
+            if (fire_time - datetime.datetime.now()).total_seconds() < refine + warmup_lead + 2:
+                refine = 0
+            wait = make_scheduler(prepared.session, clock_sync_samples, refine_rounds=refine) if clock_sync else wait_until
+            if clock_sync:
+                logger.info(f"服务器时钟偏差：{wait.stats}")
+            if release_history_file:
+                profiler = ReleaseProfiler(prepared.resource_id, target_time, wait.stats if clock_sync else None)
+            print(f"等待到指定时间：{target_time}" + (f"（提前 {lead} 秒）" if lead else ""))
+            keeper = None
+            if keepalive_interval > 0:
+                keeper = SessionKeeper(prepared.session, prepared.cookie_file, keepalive_interval, until=target_time)
+                keeper.start()
+            try:
+                wait_until_warm(prepared.session, fire_time, warmup_connections, warmup_lead, wait=wait)
+            finally:
+                if keeper:
+                    keeper.stop()
+        try:
+            run_prepared(logger, prepared, config, pacer, "（命令行模式）", on_response=profiler.observe if profiler else None)
+        finally:
+            if profiler:
+                profiler.save(release_history_file)
+    except KeyboardInterrupt:
+        logger.info("用户中断程序（命令行模式）")
+        print("\n用户中断程序")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,177 @@
+"""
+多进程批量预约
+
+batch.py 在一个进程里用协程驱动所有任务，几百个账号同时开抢时，TLS 握手、表单编码和 json 解析的CPU开销
+都挤在一个进程（一个GIL）里。这里把任务按账号分片到多个进程：
+1. 主进程读取任务文件，按 cookie 文件分组（同一个账号的任务一定在同一个进程，共用session和并发上限），
+   按任务数均匀分给各个进程；主进程校准一次服务器时钟
+2. 每个进程各自加载、检查session，解析场地ID，预热自己的连接池（开抢前 warmup_lead 秒再刷新一次）
+3. 所有进程准备好之后一起开始等待，用主进程校准的同一个时钟偏差在同一时刻提交
+4. 主进程收集各进程的结果，输出一份汇总，合并开放时刻记录
+
+用法：
+    python worker_pool.py --jobs jobs.json --workers 4 --report pool_report.json
+任务文件格式与 batch.py 相同（见 jobs.example.json），只有一个任务时也可以用。
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+
+from batch import load_jobs, prepare_jobs, print_summary, run_jobs, warm_up_jobs
+from eportal import get_session_with_cookie
+from clock_sync import measure_clock_offset, refine_clock_offset
+from release_profile import DEFAULT_HISTORY_FILE, merge_records, save_record
+from log_queue import setup_logging
+
+
+def shard_jobs(jobs, workers):
+    """
+    按 cookie 文件把任务分成最多 workers 片，任务多的账号先分，每次分给当前任务最少的一片
+    :return: 每片的任务序号列表
+    """
+    groups = defaultdict(list)
+    for i, job in enumerate(jobs):
+        groups[job.get('cookie_file', 'cookie.txt')].append(i)
+    shards = [[] for _ in range(max(1, min(workers, len(groups))))]
+    for indices in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(indices)
+    return [sorted(shard) for shard in shards if shard]
+
+
+def calibrate_clock(jobs, defaults):
+    """用第一个任务的账号校准服务器时钟，所有进程共用这个结果"""
+    session = get_session_with_cookie(jobs[0].get('cookie_file', 'cookie.txt'))
+    if not session:
+        return {}
+    clock = measure_clock_offset(session, defaults.get('clock_sync_samples', 12)) or {}
+    refine = defaults.get('clock_sync_refine', 6)
+    if clock and refine:
+        clock = refine_clock_offset(session, clock, refine)
+    if clock:
+        print(f"[校时] 服务器时钟偏差 {clock['offset'] * 1000:+.0f}ms（±{clock['uncertainty'] * 1000:.0f}ms），"
+              f"RTT {clock['rtt'] * 1000:.0f}ms")
+    return clock
+
+
+def _worker(shard, jobs, defaults, clock, barrier, results_queue, ready_timeout):
+    """子进程：准备、等待其他进程、提交，结果放进 results_queue"""
+    started = time.perf_counter()
+    setup_logging()
+    report = {"shard": shard, "pid": os.getpid(), "results": None, "releases": [], "error": None}
+    profilers = {}
+    try:
+        results, runnable, sessions = prepare_jobs(jobs, defaults)
+        report['results'] = results
+        if runnable:
+            warm_up_jobs(runnable, sessions, defaults)
+        report['ready'] = round(time.perf_counter() - started, 3)
+        try:
+            barrier.wait(ready_timeout)
+        except Exception:
+            print(f"[进程{shard}] 等待其他进程准备超时，直接开始")
+        if runnable:
+            run_jobs(runnable, clock, profilers, defaults.get('release_history_file', DEFAULT_HISTORY_FILE),
+                     defaults.get('warmup_lead', 3))
+    except Exception as e:
+        report['error'] = str(e)
+        try:
+            barrier.abort()
+        except Exception:
+            pass
+    finally:
+        report['releases'] = [p.record() for p in profilers.values()]
+        report['elapsed'] = round(time.perf_counter() - started, 3)
+        results_queue.put(report)
+
+
+def run_pool(jobs_file, workers=None, ready_timeout=120, report_file=None):
+    """
+    多进程执行任务文件中的全部任务
+    :param workers: 进程数，默认CPU核数
+    :param ready_timeout: 等待所有进程准备好的最长时间（秒）
+    :param report_file: 可选，汇总写入的json文件
+    :return: 每个任务的结果列表（与任务文件顺序相同）
+    """
+    jobs, defaults = load_jobs(jobs_file)
+    if not jobs:
+        print("任务文件中没有任务")
+        return []
+    shards = shard_jobs(jobs, workers or os.cpu_count() or 1)
+    print(f"共 {len(jobs)} 个任务，分给 {len(shards)} 个进程：{[len(s) for s in shards]}")
+    clock = calibrate_clock(jobs, defaults) if defaults.get('clock_sync', True) else {}
+
+    # spawn 在 Windows/Linux/macOS 上行为一致，子进程不继承主进程的连接
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(len(shards))
+    results_queue = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(n, [jobs[i] for i in shard], defaults, clock, barrier,
+                                                   results_queue, ready_timeout), daemon=True)
+                 for n, shard in enumerate(shards)]
+    for p in processes:
+        p.start()
+
+    reports = {}
+    while len(reports) < len(processes):
+        try:
+            report = results_queue.get(timeout=1)
+        except Exception:
+            if not any(p.is_alive() for p in processes):
+                break
+            continue
+        reports[report['shard']] = report
+    for p in processes:
+        p.join(timeout=5)
+
+    results = [None] * len(jobs)
+    releases = defaultdict(list)
+    for n, shard in enumerate(shards):
+        report = reports.get(n)
+        if report and report['error']:
+            print(f"[进程{n}] 出错：{report['error']}")
+        shard_results = report['results'] if report and report['results'] else [None] * len(shard)
+        for i, result in zip(shard, shard_results):
+            results[i] = result or {"name": jobs[i]['name'], "resource_id": jobs[i].get('resource_id'),
+                                    "date": jobs[i].get('date'), "status": "进程异常"}
+        for record in report['releases'] if report else []:
+            releases[(record['resource_id'], record['target'])].append(record)
+
+    history_file = defaults.get('release_history_file', DEFAULT_HISTORY_FILE)
+    if history_file:
+        for records in releases.values():
+            save_record(merge_records(records), history_file)
+    print_summary(results)
+
+    if report_file:
+        summary = {
+            "time": datetime.datetime.now().isoformat(timespec='seconds'),
+            "jobs_file": jobs_file,
+            "clock": clock,
+            "workers": [{k: r.get(k) for k in ('shard', 'pid', 'ready', 'elapsed', 'error')} for r in reports.values()],
+            "results": results,
+        }
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"汇总已写入 {report_file}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程批量预约')
+    parser.add_argument('--jobs', type=str, default='jobs.json', help='任务文件')
+    parser.add_argument('--workers', type=int, help='进程数，默认CPU核数')
+    parser.add_argument('--ready-timeout', type=float, default=120, help='等待所有进程准备好的最长时间（秒）')
+    parser.add_argument('--report', type=str, help='汇总写入的json文件')
+    args = parser.parse_args()
+    setup_logging()
+    try:
+        run_pool(args.jobs, args.workers, args.ready_timeout, args.report)
+    except KeyboardInterrupt:
+        print("\n用户中断程序")
+
+
+if __name__ == "__main__":
+    main()